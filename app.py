@@ -7,6 +7,7 @@ import treetab
 import historytab
 import edittab
 import fuzztab
+import searchtab
 from tkinter import *
 import ttkbootstrap as tb
 
@@ -42,6 +43,8 @@ class App(tb.Window):
 		self.edit_view = edittab.EditTab(self.nb_tbs)
 		# Add the fuzzer tab to the notebook
 		self.fuzz_tab = fuzztab.FuzzTab(self.nb_tbs)
+		# Add the global search tab to the notebook
+		self.search_tab = searchtab.SearchTab(self.nb_tbs)
 
 	def run(self) -> None:
 		'''Runs the main GUI window'''
@@ -0,0 +1,316 @@
+#! /usr/bin/env python3
+
+import ssl
+import gzip
+import time
+import zlib
+import asyncio
+from urllib.parse import urlsplit
+
+class ProtocolError(ConnectionError):
+	'''A response that is not valid HTTP/1.x, reported as a connection error like requests does'''
+
+class AsyncResponse:
+
+	def __init__(self, status_code: int, reason: str, headers: dict, content: bytes) -> None:
+		'''Initialize a response shaped like a requests response for the content beautifier'''
+		self.status_code = status_code
+		self.reason = reason
+		self.headers = headers
+		self.content = content
+		self.raw = True
+
+class AsyncFuzzer:
+
+	def __init__(self, fzr) -> None:
+		'''Initialize an asyncio engine around a fuzzer, reusing its templates, encoders and results'''
+		self.fzr = fzr
+		self.pool = {}
+		self.limits = {}
+		# Idle connections kept per origin, like pool_maxsize on the threaded engine
+		self.max_idle = fzr.pool_maxsize or fzr.threads
+		self.num_connections = 0
+		self.num_requests = 0
+		self.decodable = ("gzip", "deflate")
+		self.ssl_context = ssl.create_default_context()
+		# Same as verify=False on the threaded engine
+		self.ssl_context.check_hostname = False
+		self.ssl_context.verify_mode = ssl.CERT_NONE
+
+	def _origin(self, url: str) -> tuple:
+		'''Return the (scheme, host, port) a request connects to and its request target'''
+		parts = urlsplit(url)
+		if parts.scheme not in ("http", "https") or not parts.hostname:
+			raise ValueError(f"Unsupported URL: {url}")
+		port = parts.port
+		if port is None:
+			port = 443 if parts.scheme == "https" else 80
+		target = parts.path or "/"
+		if parts.query:
+			target += "?" + parts.query
+		return ((parts.scheme, parts.hostname, port), target, parts.netloc)
+
+	async def _connect(self, origin: tuple) -> tuple:
+		'''Open a new connection to an origin'''
+		scheme, host, port = origin
+		self.num_connections += 1
+		if scheme == "https":
+			return await asyncio.open_connection(host, port, ssl=self.ssl_context, server_hostname=host)
+		return await asyncio.open_connection(host, port)
+
+	def _acquire(self, origin: tuple):
+		'''Return an idle keep-alive connection to an origin, or None'''
+		idle = self.pool.get(origin)
+		while idle:
+			reader, writer = idle.pop()
+			if not writer.is_closing() and not reader.at_eof():
+				return (reader, writer)
+			writer.close()
+		return None
+
+	def _limit(self, origin: tuple):
+		'''Return the semaphore capping open connections to an origin when the pool blocks'''
+		if origin not in self.limits:
+			self.limits[origin] = asyncio.Semaphore(self.max_idle)
+		return self.limits[origin]
+
+	def _release(self, origin: tuple, reader, writer) -> None:
+		'''Return a connection to the pool, connections beyond its size are closed'''
+		idle = self.pool.setdefault(origin, [])
+		if self.fzr.keep_alive and len(idle) < self.max_idle:
+			idle.append((reader, writer))
+		else:
+			writer.close()
+
+	def _close_pool(self) -> None:
+		'''Close every idle connection'''
+		for idle in self.pool.values():
+			for reader, writer in idle:
+				writer.close()
+		self.pool = {}
+
+	def _encode_request(self, req_data: dict, target: str, netloc: str) -> bytes:
+		'''Return the raw HTTP/1.1 request bytes'''
+		body = req_data["data"].encode("utf-8")
+		headers = {}
+		for name, value in req_data["headers"].items():
+			# Framing is recomputed since payloads change the body length
+			if name.lower() not in ("content-length", "transfer-encoding", "connection", "accept-encoding"):
+				headers[name] = value
+		if not any(name.lower() == "host" for name in headers):
+			headers = {"Host": netloc, **headers}
+		headers["Accept-Encoding"] = ", ".join(self.decodable)
+		headers["Connection"] = "keep-alive" if self.fzr.keep_alive else "close"
+		if body or req_data["method"].upper() in ("POST", "PUT", "PATCH"):
+			headers["Content-Length"] = str(len(body))
+		lines = [f"{req_data['method']} {target} HTTP/1.1"]
+		lines.extend(f"{name}: {value}" for name, value in headers.items())
+		return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "replace") + body
+
+	async def _read_headers(self, reader) -> tuple:
+		'''Return the version, status code, reason and headers of a response'''
+		while 1:
+			status_line = await reader.readline()
+			if not status_line:
+				raise ConnectionResetError("Connection closed by the server")
+			version, status_code, reason = (status_line.decode("latin-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+			if not version.startswith("HTTP/") or len(status_code) != 3 or not status_code.isdigit():
+				raise ProtocolError(f"Bad status line: {status_line[:100]!r}")
+			headers = {}
+			names = {}
+			while 1:
+				line = await reader.readline()
+				if line in (b"\r\n", b"\n", b""):
+					break
+				# Skipped like http.client does on the threaded engine
+				if b":" not in line:
+					continue
+				name, value = line.decode("latin-1").rstrip("\r\n").split(":", 1)
+				name = name.strip()
+				value = value.strip()
+				# Repeated headers are joined like requests does
+				if name.lower() in names:
+					headers[names[name.lower()]] += ", " + value
+				else:
+					names[name.lower()] = name
+					headers[name] = value
+			# Skip interim responses such as 100 Continue
+			if not status_code.startswith("1") or status_code == "101":
+				return (version, int(status_code), reason, headers)
+
+	def _parse_length(self, value, base: int=10) -> int:
+		'''Return a length field of a response, -1 if it is not a number'''
+		try:
+			number = int(value, base)
+		except ValueError:
+			return -1
+		return number if number >= 0 else -1
+
+	def _header(self, headers: dict, name: str) -> str:
+		'''Return a header value by case-insensitive name'''
+		for key, value in headers.items():
+			if key.lower() == name:
+				return value
+		return ""
+
+	async def _read_chunked(self, reader) -> bytes:
+		'''Return a chunked transfer encoded body'''
+		chunks = []
+		while 1:
+			size_line = await reader.readline()
+			size = self._parse_length(size_line.split(b";", 1)[0].strip() or b"0", 16)
+			if size < 0:
+				raise ProtocolError(f"Bad chunk size: {size_line[:100]!r}")
+			if size == 0:
+				# Discard trailers
+				while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+					pass
+				break
+			chunks.append(await reader.readexactly(size))
+			await reader.readexactly(2)
+		return b"".join(chunks)
+
+	def _decode_body(self, body: bytes, encoding: str) -> bytes:
+		'''Return a body with gzip or deflate content encoding removed'''
+		encoding = encoding.strip().lower()
+		try:
+			if encoding == "gzip":
+				return gzip.decompress(body)
+			if encoding == "deflate":
+				try:
+					return zlib.decompress(body)
+				except zlib.error:
+					return zlib.decompress(body, -zlib.MAX_WBITS)
+		except (OSError, EOFError, zlib.error):
+			pass
+		return body
+
+	async def _read_response(self, reader, method: str) -> tuple:
+		'''Return a response and whether its connection can be reused'''
+		version, status_code, reason, headers = await self._read_headers(reader)
+		connection = self._header(headers, "connection").lower()
+		keep_alive = (version == "HTTP/1.1" and connection != "close") or connection == "keep-alive"
+		length = self._parse_length(self._header(headers, "content-length") or "-1")
+		if method.upper() == "HEAD" or status_code in (204, 304):
+			body = b""
+		elif "chunked" in self._header(headers, "transfer-encoding").lower():
+			body = await self._read_chunked(reader)
+		elif length >= 0:
+			body = await reader.readexactly(length)
+		else:
+			# Body ends when the server closes the connection
+			body = await reader.read()
+			keep_alive = False
+		encoding = self._header(headers, "content-encoding")
+		if body and encoding:
+			body = self._decode_body(body, encoding)
+		return (AsyncResponse(status_code, reason, headers, body), keep_alive)
+
+	async def _fetch(self, req_data: dict) -> AsyncResponse:
+		'''Send a request over a pooled connection and return its response'''
+		origin, target, netloc = self._origin(req_data["url"])
+		if self.fzr.pool_block:
+			# Wait for a pooled connection instead of opening extra ones
+			async with self._limit(origin):
+				return await self._exchange(origin, target, netloc, req_data)
+		return await self._exchange(origin, target, netloc, req_data)
+
+	async def _exchange(self, origin: tuple, target: str, netloc: str, req_data: dict) -> AsyncResponse:
+		'''Write a request on a pooled or new connection and read its response'''
+		raw = self._encode_request(req_data, target, netloc)
+		conn = self._acquire(origin)
+		reused = conn is not None
+		while 1:
+			if conn is None:
+				conn = await self._connect(origin)
+			reader, writer = conn
+			self.num_requests += 1
+			try:
+				writer.write(raw)
+				await writer.drain()
+				response, keep_alive = await self._read_response(reader, req_data["method"])
+			except (ConnectionError, asyncio.IncompleteReadError):
+				writer.close()
+				# The server may have dropped an idle keep-alive connection, retry once on a new one
+				if reused:
+					conn = None
+					reused = False
+					continue
+				raise
+			except BaseException:
+				writer.close()
+				raise
+			break
+		if keep_alive:
+			self._release(origin, reader, writer)
+		else:
+			writer.close()
+		return response
+
+	async def _send_request(self, req_data: dict) -> tuple:
+		'''Send a request and return the fuzz table row and raw response'''
+		error = ""
+		timeout = "N"
+		r = None
+		t1 = time.time()
+		t2 = t1
+		try:
+			r = await asyncio.wait_for(self._fetch(req_data), self.fzr.timeout)
+			t2 = time.time()
+		except asyncio.TimeoutError:
+			error = "Timeout Error"
+			timeout = "Y"
+		except (OSError, asyncio.IncompleteReadError):
+			error = "Connection Error"
+		except ValueError:
+			error = "URL Error"
+		except Exception:
+			error = "Generic Request Error"
+		# Reflection, fingerprint and compression run in a thread so in-flight requests keep moving
+		return await asyncio.get_running_loop().run_in_executor(None, self.fzr._result_row, req_data, r, t1, t2, error, timeout)
+
+	async def _wait_for_slot(self) -> bool:
+		'''Wait until the rules, the adaptive controller and the rate cap allow another request, False if the fuzzer stopped'''
+		while self.fzr.rules.pause_remaining():
+			if not self.fzr.is_running:
+				return False
+			await asyncio.sleep(min(0.5, self.fzr.rules.pause_remaining()))
+		if self.fzr.controller:
+			while not self.fzr.controller.try_acquire():
+				if not self.fzr.is_running:
+					return False
+				await asyncio.sleep(0.01)
+		wait = self.fzr.bucket.reserve()
+		if wait:
+			await asyncio.sleep(wait)
+		return True
+
+	async def _worker(self, requests) -> None:
+		'''Send requests until the payloads run out or the fuzzer is stopped'''
+		while self.fzr.is_running:
+			# Workers share one generator, the event loop never runs two next() calls at once
+			try:
+				req_data = next(requests)
+			except StopIteration:
+				break
+			if not await self._wait_for_slot():
+				break
+			results = await self._send_request(req_data)
+			self.fzr._record_result(results)
+			# Yield to the other requests instead of blocking the loop while the writer catches up
+			while self.fzr.results_queue.full():
+				await asyncio.sleep(0.05)
+			self.fzr.results_queue.put(results)
+			if self.fzr.delay:
+				await asyncio.sleep(self.fzr.delay)
+
+	async def _run(self, requests) -> None:
+		'''Run the workers and close the pool when they finish'''
+		try:
+			await asyncio.gather(*[self._worker(requests) for i in range(max(1, self.fzr.threads))])
+		finally:
+			self._close_pool()
+
+	def run(self, requests) -> None:
+		'''Send every request from an iterator with the fuzzer's concurrency as in-flight requests'''
+		asyncio.run(self._run(requests))
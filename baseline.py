@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+
+import re
+import sqlite3
+import statistics
+from collections import Counter
+import bodystore
+import responsecluster
+
+class Baseline:
+
+	def __init__(self) -> None:
+		'''Initialize the baseline a fuzz run compares every result against'''
+		self.bs = bodystore.BodyStore()
+		self.rc = responsecluster.ResponseClusterer()
+		# Tag names and JSON keys, the skeleton of a response without its text
+		self.structure_tokens = re.compile(rb"<\s*(/?[a-zA-Z][\w:-]*)|\"([^\"\\\\]{1,64})\"\s*:")
+		self.status_codes = []
+		self.lengths = []
+		self.word_counts = []
+		self.line_counts = []
+		self.rtts = []
+		self.structure = 0
+
+	def structure_hash(self, body: bytes) -> int:
+		'''Return a simhash of the markup tags and JSON keys of a body'''
+		counts = Counter(tag or key for tag, key in self.structure_tokens.findall(body[:self.rc.max_body]))
+		return self.rc.simhash(Counter({token.decode("latin-1").lower(): min(weight, 16) for token, weight in counts.items()}))
+
+	def add(self, status_code: str, body: bytes, rtt: float=None) -> None:
+		'''Add a response to the baseline, rtt is None for a response that was not timed'''
+		if not self.status_codes:
+			self.structure = self.structure_hash(body)
+		self.status_codes.append(status_code)
+		self.lengths.append(len(body))
+		self.word_counts.append(self.rc.fingerprint(status_code, {}, body, ())[1])
+		self.line_counts.append(body.count(b"\n"))
+		if rtt is not None:
+			self.rtts.append(rtt)
+
+	def add_transaction(self, cursor: sqlite3.Cursor, transaction_id: int) -> bool:
+		'''Add the captured response of a transaction, return False if it has none'''
+		cursor.execute('''SELECT t.response_status_code, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.response_body_hash WHERE t.id = ?;''', (transaction_id,))
+		row = cursor.fetchone()
+		if not row or not row[0]:
+			return False
+		body = self.bs.decode(row[1]) if row[1] is not None else ""
+		self.add(str(row[0]), body.encode("utf-8", "replace"))
+		return True
+
+	def is_empty(self) -> bool:
+		'''Return True if no baseline response was recorded'''
+		return not self.status_codes
+
+	def deltas(self, status_code: str, body: bytes, word_count: int, rtt: float) -> tuple:
+		'''Return (status changed, length, word, line deltas, RTT z-score, structure distance) of a response against the baseline'''
+		if self.is_empty():
+			return (None, None, None, None, None, None)
+		status = Counter(self.status_codes).most_common(1)[0][0]
+		rtt_z = None
+		if self.rtts:
+			mean = statistics.fmean(self.rtts)
+			stdev = statistics.pstdev(self.rtts) if len(self.rtts) > 1 else 0.0
+			# A handful of samples understates the spread, floor it so small jitter is not an outlier
+			rtt_z = round((rtt - mean) / max(stdev, mean * 0.1, 0.005), 2)
+		return (
+			int(status_code != status),
+			len(body) - round(statistics.fmean(self.lengths)),
+			word_count - round(statistics.fmean(self.word_counts)),
+			body.count(b"\n") - round(statistics.fmean(self.line_counts)),
+			rtt_z,
+			bin(self.structure_hash(body) ^ self.structure).count("1")
+		)
+
+	def error_deltas(self) -> tuple:
+		'''Return the deltas of a request that got no response'''
+		return (None if self.is_empty() else 1, None, None, None, None, None)
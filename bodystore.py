@@ -0,0 +1,209 @@
+#! /usr/bin/env python3
+
+import zlib
+import base64
+import struct
+import hashlib
+import sqlite3
+
+# zstd is optional, zlib is always available
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+class BodyStore:
+
+	def __init__(self, batch_size: int=500, compression: str="none") -> None:
+		'''Initialize content-addressed storage for request and response bodies'''
+		self.batch_size = batch_size
+		self.compression = compression
+		self.binary_start = "<BINARY_DATA>"
+		self.binary_end = "</BINARY_DATA>"
+		# Stored BLOBs begin with a codec byte then a kind byte (t=text, b=text prefix + raw binary)
+		self.codecs = {
+			"none": b"r",
+			"zlib": b"z",
+			"zstd": b"s"
+		}
+
+	def best_compression(self) -> str:
+		'''Return the strongest compression available on this system'''
+		if zstandard:
+			return "zstd"
+		return "zlib"
+
+	def load_settings(self, cursor: sqlite3.Cursor) -> None:
+		'''Use the body storage mode recorded in the database'''
+		try:
+			cursor.execute('''SELECT value FROM settings WHERE name = 'body_compression';''')
+			row = cursor.fetchone()
+		except sqlite3.OperationalError:
+			row = None
+		if row:
+			self.compression = row[0]
+		else:
+			self.compression = "none"
+
+	def save_settings(self, cursor: sqlite3.Cursor) -> None:
+		'''Record the body storage mode in the database'''
+		cursor.execute('''CREATE TABLE IF NOT EXISTS settings (
+			name TEXT PRIMARY KEY,
+			value TEXT
+		);''')
+		cursor.execute('''INSERT OR REPLACE INTO settings (name, value) VALUES ('body_compression', ?);''', (self.compression,))
+
+	def _split_binary(self, body: str) -> tuple:
+		'''Return (text prefix, raw bytes) if the body ends in base64 binary data, otherwise None'''
+		if not body.endswith(self.binary_end):
+			return None
+		start = body.find(self.binary_start)
+		if start == -1:
+			return None
+		encoded = body[start+len(self.binary_start):-len(self.binary_end)]
+		try:
+			raw = base64.b64decode(encoded, validate=True)
+		except ValueError:
+			return None
+		# Only store raw bytes when the original text can be rebuilt exactly
+		if base64.b64encode(raw).decode("ascii") != encoded:
+			return None
+		return (body[:start], raw)
+
+	def _compress(self, data: bytes) -> tuple:
+		'''Return (codec byte, data) using the configured compression'''
+		if self.compression == "zstd" and zstandard:
+			packed = zstandard.ZstdCompressor().compress(data)
+			codec = self.codecs["zstd"]
+		elif self.compression in ("zlib", "zstd"):
+			packed = zlib.compress(data, 6)
+			codec = self.codecs["zlib"]
+		else:
+			return (self.codecs["none"], data)
+		# Already compressed content (images, fonts) is kept as is
+		if len(packed) >= len(data):
+			return (self.codecs["none"], data)
+		return (codec, packed)
+
+	def encode(self, body: str):
+		'''Return the value to store for a body in the configured storage mode'''
+		if (not body) or (self.compression == "none"):
+			return body
+		binary = self._split_binary(body)
+		if binary:
+			prefix, raw = binary
+			prefix = prefix.encode("utf-8", "surrogatepass")
+			kind = b"b"
+			data = struct.pack(">I", len(prefix)) + prefix + raw
+		else:
+			kind = b"t"
+			data = body.encode("utf-8", "surrogatepass")
+		codec, data = self._compress(data)
+		return codec + kind + data
+
+	def decode(self, value) -> str:
+		'''Return the text of a stored body, decompressing it if needed'''
+		if not isinstance(value, bytes):
+			return value
+		codec = value[0:1]
+		kind = value[1:2]
+		data = value[2:]
+		if codec == self.codecs["zlib"]:
+			data = zlib.decompress(data)
+		elif codec == self.codecs["zstd"]:
+			if not zstandard:
+				return "//BODY IS ZSTD COMPRESSED, INSTALL THE zstandard PACKAGE TO VIEW IT"
+			data = zstandard.ZstdDecompressor().decompress(data)
+		if kind == b"b":
+			size = struct.unpack(">I", data[:4])[0]
+			prefix = data[4:4+size].decode("utf-8", "surrogatepass")
+			raw = data[4+size:]
+			return prefix + self.binary_start + base64.b64encode(raw).decode("ascii") + self.binary_end
+		return data.decode("utf-8", "surrogatepass")
+
+	def decode_prefix(self, value, size: int) -> str:
+		'''Return about the first size bytes of a stored body's text, only that much is decompressed'''
+		if not isinstance(value, bytes):
+			return value[:size] if value else value
+		codec = value[0:1]
+		kind = value[1:2]
+		data = value[2:]
+		# Binary bodies keep their text prefix first, the base64 data is not wanted here
+		limit = size + 4 if kind == b"b" else size
+		if codec == self.codecs["zlib"]:
+			data = zlib.decompressobj().decompress(data, limit)
+		elif codec == self.codecs["zstd"]:
+			if not zstandard:
+				return "//BODY IS ZSTD COMPRESSED, INSTALL THE zstandard PACKAGE TO VIEW IT"
+			data = zstandard.ZstdDecompressor().stream_reader(data).read(limit)
+		if kind == b"b":
+			prefix_size = struct.unpack(">I", data[:4])[0]
+			return data[4:4+min(prefix_size, size)].decode("utf-8", "replace")
+		# A multi-byte character cut at the end is replaced rather than raising
+		return data[:size].decode("utf-8", "replace")
+
+	def digest(self, body: str) -> str:
+		'''Return the content address of a body'''
+		return hashlib.sha256(body.encode("utf-8", "surrogatepass")).hexdigest()
+
+	def prepare(self, body: str) -> tuple:
+		'''Return (hash, stored value) for a body, or (None, None) when there is no body'''
+		if body:
+			return (self.digest(body), self.encode(body))
+		return (None, None)
+
+	def store_many(self, cursor: sqlite3.Cursor, bodies: list) -> None:
+		'''Insert (hash, content) pairs, keeping a single copy of each body'''
+		unique = dict(i for i in bodies if i[0])
+		if unique:
+			cursor.executemany('''INSERT OR IGNORE INTO bodies (hash, content) VALUES (?,?);''', unique.items())
+
+	def create_table(self, cursor: sqlite3.Cursor) -> None:
+		'''Create the bodies table'''
+		cursor.execute('''CREATE TABLE IF NOT EXISTS bodies (
+			hash TEXT PRIMARY KEY,
+			content BLOB
+		);''')
+
+	def needs_migration(self, cursor: sqlite3.Cursor) -> bool:
+		'''Return True if the transactions table predates content-addressed bodies'''
+		columns = [i[1] for i in cursor.execute('''PRAGMA table_info(transactions);''')]
+		return bool(columns) and ("request_body_hash" not in columns)
+
+	def migrate(self, conn: sqlite3.Connection) -> None:
+		'''Move inline transaction bodies of an older database into the bodies table'''
+		cursor = conn.cursor()
+		if not self.needs_migration(cursor):
+			return
+		# One transaction so an interrupted migration leaves the old layout intact
+		conn.commit()
+		cursor.execute('''BEGIN;''')
+		self.create_table(cursor)
+		cursor.execute('''ALTER TABLE transactions ADD COLUMN request_body_hash TEXT;''')
+		cursor.execute('''ALTER TABLE transactions ADD COLUMN response_body_hash TEXT;''')
+		last_id = 0
+		while 1:
+			cursor.execute('''SELECT id, request_body, response_body FROM transactions WHERE id > ? ORDER BY id LIMIT ?;''', (last_id, self.batch_size))
+			rows = cursor.fetchall()
+			if not rows:
+				break
+			bodies = []
+			updates = []
+			for rowid, request_body, response_body in rows:
+				request_hash, request_content = self.prepare(request_body)
+				response_hash, response_content = self.prepare(response_body)
+				bodies.append((request_hash, request_content))
+				bodies.append((response_hash, response_content))
+				updates.append((request_hash, response_hash, rowid))
+				last_id = rowid
+			self.store_many(cursor, bodies)
+			cursor.executemany('''UPDATE transactions SET request_body_hash = ?, response_body_hash = ?, request_body = NULL, response_body = NULL WHERE id = ?;''', updates)
+		# Drop the inline columns where SQLite supports it, otherwise they are left empty
+		try:
+			cursor.execute('''ALTER TABLE transactions DROP COLUMN request_body;''')
+			cursor.execute('''ALTER TABLE transactions DROP COLUMN response_body;''')
+		except sqlite3.OperationalError:
+			pass
+		conn.commit()
+		# Reclaim the space freed by the duplicate bodies
+		cursor.execute('''VACUUM;''')
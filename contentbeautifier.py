@@ -11,12 +11,16 @@ class ContentBeautifier:
 	def __init__(self) -> None:
 		'''Initialize content beautifier'''
 		self.hp = harparse.Harparse()
+		# Bodies larger than this are shown as they are, beautifying them costs seconds of CPU
+		self.max_size = 1024 * 1024
 
 	def beautify(self, mime: str, content: str, binary: bool) -> str:
 		'''Try to beautify content before returning'''
 		if binary:
 			bin_body = "<BINARY_DATA>" + base64.b64encode(content).decode("utf-8") + "</BINARY_DATA>"
 			return bin_body
+		elif len(content) > self.max_size:
+			return content
 		else:
 			try:
 				if mime == "JAVASCRIPT":
@@ -46,8 +50,7 @@ class ContentBeautifier:
 		if body:
 			# Attempt beautification
 			content_type = self.hp.get_content_type(headers)
-			mime = self.hp.evaluate_mimetype(body, content_type)
-			body = self.beautify(mime, body, False)
+			body = self._beautify_text(body, content_type)
 			request += body
 		return request
 
@@ -61,13 +64,34 @@ class ContentBeautifier:
 		if body:
 			# Attempt beautification
 			content_type = self.hp.get_content_type(headers)
-			mime = self.hp.evaluate_mimetype(body, content_type)
-			body = self.beautify(mime, body, False)
+			body = self._beautify_text(body, content_type)
 			response += body
 		return response
 
-	def rebuild_response_requests(self, response) -> str:
-		'''Return a string formatted to look like a raw response using response object from requests'''
+	def _beautify_text(self, body: str, content_type: str) -> str:
+		'''Return a text body beautified by its type, bodies over the size cap skip type detection too'''
+		if len(body) > self.max_size:
+			return body
+		mime = self.hp.evaluate_mimetype(body, content_type)
+		return self.beautify(mime, body, False)
+
+	def beautify_raw_response(self, raw_response: str) -> str:
+		'''Return a raw response stored without beautification with its body beautified'''
+		head, separator, body = raw_response.partition("\n\n")
+		if not body or body.startswith("<BINARY_DATA>"):
+			return raw_response
+		content_type = ""
+		for line in head.split("\n")[1:]:
+			name, colon, value = line.partition(":")
+			if name.strip().lower() == "content-type":
+				content_type = value.strip()
+		# Same rule as rebuild_response_requests, bodies without a content type are left alone
+		if not content_type:
+			return raw_response
+		return head + separator + self._beautify_text(body, content_type)
+
+	def rebuild_response_requests(self, response, beautify: bool=True) -> str:
+		'''Return a string formatted to look like a raw response using response object from requests, beautify=False keeps the body as received'''
 		# Build response headers
 		text = f"HTTP/1.1 {response.status_code} {response.reason}\n"
 		for name in response.headers:
@@ -87,8 +111,9 @@ class ContentBeautifier:
 			except:
 				body = response.content
 				binary = True
-			if content_type:
-				mime = self.hp.evaluate_mimetype(body, content_type)
-				body = self.beautify(mime, body, binary)
+			if binary:
+				body = self.beautify("", body, True)
+			elif content_type and beautify:
+				body = self._beautify_text(body, content_type)
 		text += body
 		return text
@@ -4,13 +4,14 @@ import os
 import re
 import json
 import urllib
+import bodystore
 from tkinter import filedialog
 
 class ContextMenu:
 
 	def __init__(self):
 		'''Initialize functions used on multiple context menus'''
-		pass
+		self.bs = bodystore.BodyStore()
 
 	def copy(self, widget) -> str:
 		'''Return a string of selected text'''
@@ -26,10 +27,11 @@ class ContextMenu:
 	def copy_as_curl(self, widget, rowid, cursor) -> str:
 		'''Copy curl command to the clipboard'''
 		if rowid != -1:
-			cursor.execute('''SELECT request_method, request_url, request_headers, request_body_type, request_body FROM transactions WHERE id = ?;''',(rowid,))
+			cursor.execute('''SELECT t.request_method, t.request_url, t.request_headers, t.request_body_type, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.request_body_hash WHERE t.id = ?;''',(rowid,))
 			results = cursor.fetchone()
 			if results:
 				method, url, headers, body_type, body = results
+				body = self.bs.decode(body)
 				command = f"curl -X {method}"
 				headers = json.loads(headers)
 				for header in headers:
@@ -0,0 +1,218 @@
+#! /usr/bin/env python3
+
+import sqlite3
+import bodystore
+import searchindex
+
+class DBSchema:
+
+	def __init__(self) -> None:
+		'''Initialize the versioned database schema'''
+		self.bs = bodystore.BodyStore()
+		self.si = searchindex.SearchIndex()
+		# Applied in order, the schema version is the number of migrations applied
+		self.migrations = [
+			self._create_tables,
+			self._migrate_bodies,
+			self._add_settings,
+			self._add_indexes,
+			self._add_search_index,
+			self._add_fuzz_payload_index,
+			self._add_fuzz_runs,
+			self._add_fuzz_reflection,
+			self._add_fuzz_clusters,
+			self._add_fuzz_deltas
+		]
+
+	def latest_version(self) -> int:
+		'''Return the schema version this build writes'''
+		return len(self.migrations)
+
+	def get_version(self, cursor: sqlite3.Cursor) -> int:
+		'''Return the schema version recorded in the database'''
+		return cursor.execute('''PRAGMA user_version;''').fetchone()[0]
+
+	def upgrade(self, conn: sqlite3.Connection) -> int:
+		'''Apply every pending migration in place and return the resulting version'''
+		cursor = conn.cursor()
+		version = self.get_version(cursor)
+		# A database from a newer build is left untouched
+		for i in range(version, self.latest_version()):
+			self.migrations[i](conn, i + 1)
+		return self.get_version(cursor)
+
+	def _set_version(self, cursor: sqlite3.Cursor, version: int) -> None:
+		'''Record the schema version, inside the migration's transaction so a crash cannot apply a migration twice'''
+		cursor.execute(f'''PRAGMA user_version = {int(version)};''')
+
+	def _run_ddl(self, conn: sqlite3.Connection, statements: list, version: int) -> None:
+		'''Run schema statements and record the version they bring the database to inside a single transaction'''
+		cursor = conn.cursor()
+		conn.commit()
+		cursor.execute('''BEGIN;''')
+		for statement in statements:
+			cursor.execute(statement)
+		self._set_version(cursor, version)
+		conn.commit()
+
+	def _create_tables(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 1: create the tables of a new database, existing tables are kept'''
+		self._run_ddl(conn, [
+			'''CREATE TABLE IF NOT EXISTS transactions (
+				id INTEGER PRIMARY KEY AUTOINCREMENT,
+				timestamp TEXT,
+				ip_address TEXT,
+				port TEXT,
+				request_method TEXT,
+				request_url TEXT,
+				request_params TEXT,
+				request_headers TEXT,
+				request_has_input TEXT,
+				request_body_hash TEXT,
+				request_body_type TEXT,
+				request_file_extension TEXT,
+				response_status_code TEXT,
+				response_status_message TEXT,
+				response_headers TEXT,
+				response_body_hash TEXT
+			);''',
+			'''CREATE TABLE IF NOT EXISTS fuzz (
+				id INTEGER PRIMARY KEY AUTOINCREMENT,
+				status_code TEXT,
+				rtt TEXT,
+				content_length TEXT,
+				payloads TEXT,
+				reflected TEXT,
+				timeout TEXT,
+				errors TEXT,
+				timestamp TEXT,
+				raw_request TEXT,
+				raw_response TEXT
+			);''',
+			'''CREATE TABLE IF NOT EXISTS bodies (
+				hash TEXT PRIMARY KEY,
+				content BLOB
+			);'''
+		], version)
+
+	def _migrate_bodies(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 2: move inline bodies of older databases into the bodies table'''
+		# Commits itself before reclaiming space, a rerun finds nothing left to move
+		self.bs.migrate(conn)
+		self._run_ddl(conn, [], version)
+
+	def _add_settings(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 3: add the settings table, older databases keep uncompressed bodies'''
+		self._run_ddl(conn, [
+			'''CREATE TABLE IF NOT EXISTS settings (
+				name TEXT PRIMARY KEY,
+				value TEXT
+			);'''
+		], version)
+
+	def _add_indexes(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 4: index the columns the tabs filter and sort on'''
+		self._run_ddl(conn, [
+			# Covers the site map query so it never touches the table itself
+			'''CREATE INDEX IF NOT EXISTS idx_transactions_url ON transactions (request_url, request_method, request_params);''',
+			'''CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (response_status_code);''',
+			'''CREATE INDEX IF NOT EXISTS idx_transactions_method ON transactions (request_method);''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_status ON fuzz (status_code);'''
+		], version)
+
+	def _add_search_index(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 5: add the full-text search index and fill it from existing rows'''
+		cursor = conn.cursor()
+		conn.commit()
+		cursor.execute('''BEGIN;''')
+		# Search joins matched bodies back to their transactions by hash
+		cursor.execute('''CREATE INDEX IF NOT EXISTS idx_transactions_request_body ON transactions (request_body_hash);''')
+		cursor.execute('''CREATE INDEX IF NOT EXISTS idx_transactions_response_body ON transactions (response_body_hash);''')
+		try:
+			self.si.create(cursor)
+		except sqlite3.OperationalError:
+			# SQLite was built without FTS5, global search stays unavailable
+			self._set_version(cursor, version)
+			conn.commit()
+			return
+		self.si.rebuild(cursor)
+		self._set_version(cursor, version)
+		conn.commit()
+
+	def _add_fuzz_payload_index(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 6: record the position of each fuzz result in the payload product so runs can resume'''
+		self._run_ddl(conn, [
+			'''ALTER TABLE fuzz ADD COLUMN payload_index INTEGER;'''
+		], version)
+
+	def _add_fuzz_runs(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 7: keep every fuzz run side by side, results point at their run'''
+		cursor = conn.cursor()
+		conn.commit()
+		cursor.execute('''BEGIN;''')
+		cursor.execute('''CREATE TABLE IF NOT EXISTS fuzz_runs (
+			id INTEGER PRIMARY KEY AUTOINCREMENT,
+			template TEXT,
+			payload_files TEXT,
+			encoder TEXT,
+			settings TEXT,
+			total INTEGER,
+			completed INTEGER,
+			finished INTEGER,
+			started TEXT,
+			ended TEXT
+		);''')
+		cursor.execute('''ALTER TABLE fuzz ADD COLUMN run_id INTEGER;''')
+		# The single run older versions kept becomes the first stored run
+		count = cursor.execute('''SELECT COUNT(*) FROM fuzz;''').fetchone()[0]
+		if count:
+			cursor.execute('''INSERT INTO fuzz_runs (template, payload_files, encoder, settings, total, completed, finished, started, ended) VALUES ('','[]','None','{}',?,?,1,'','');''', (count, count))
+			cursor.execute('''UPDATE fuzz SET run_id = ?;''', (cursor.lastrowid,))
+		# Superseded by the run scoped index below
+		cursor.execute('''DROP INDEX IF EXISTS idx_fuzz_status;''')
+		cursor.execute('''CREATE INDEX IF NOT EXISTS idx_fuzz_run_status ON fuzz (run_id, status_code);''')
+		cursor.execute('''CREATE INDEX IF NOT EXISTS idx_fuzz_run_length ON fuzz (run_id, content_length);''')
+		cursor.execute('''CREATE INDEX IF NOT EXISTS idx_fuzz_run_payload_index ON fuzz (run_id, payload_index);''')
+		self._set_version(cursor, version)
+		conn.commit()
+
+	def _add_fuzz_reflection(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 8: record which form of a payload a fuzz response reflected and where'''
+		self._run_ddl(conn, [
+			'''ALTER TABLE fuzz ADD COLUMN reflection TEXT DEFAULT '';'''
+		], version)
+
+	def _add_fuzz_clusters(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 9: group fuzz responses of a run into clusters of similar responses'''
+		self._run_ddl(conn, [
+			'''ALTER TABLE fuzz ADD COLUMN simhash INTEGER;''',
+			'''ALTER TABLE fuzz ADD COLUMN cluster_id INTEGER;''',
+			'''CREATE TABLE IF NOT EXISTS fuzz_clusters (
+				id INTEGER PRIMARY KEY,
+				run_id INTEGER,
+				representative INTEGER,
+				header_key TEXT,
+				simhash INTEGER,
+				word_count INTEGER,
+				size INTEGER
+			);''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_clusters_run_size ON fuzz_clusters (run_id, size);''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_run_cluster ON fuzz (run_id, cluster_id);'''
+		], version)
+
+	def _add_fuzz_deltas(self, conn: sqlite3.Connection, version: int) -> None:
+		'''Version 10: compare each fuzz result with a baseline of the unfuzzed request'''
+		self._run_ddl(conn, [
+			'''ALTER TABLE fuzz_runs ADD COLUMN source_id INTEGER;''',
+			'''ALTER TABLE fuzz ADD COLUMN status_changed INTEGER;''',
+			'''ALTER TABLE fuzz ADD COLUMN length_delta INTEGER;''',
+			'''ALTER TABLE fuzz ADD COLUMN word_delta INTEGER;''',
+			'''ALTER TABLE fuzz ADD COLUMN line_delta INTEGER;''',
+			'''ALTER TABLE fuzz ADD COLUMN rtt_z REAL;''',
+			'''ALTER TABLE fuzz ADD COLUMN structure_delta INTEGER;''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_run_status_changed ON fuzz (run_id, status_changed);''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_run_length_delta ON fuzz (run_id, length_delta);''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_run_word_delta ON fuzz (run_id, word_delta);''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_run_rtt_z ON fuzz (run_id, rtt_z);''',
+			'''CREATE INDEX IF NOT EXISTS idx_fuzz_run_structure_delta ON fuzz (run_id, structure_delta);'''
+		], version)
@@ -9,6 +9,7 @@ from ttkbootstrap.scrolled import ScrolledText
 from ttkbootstrap.scrolled import ScrolledFrame
 import requests
 import contextmenu
+import bodystore
 import contentbeautifier
 import scrolledtextsearch
 import harparse
@@ -25,6 +26,7 @@ class EditTab(tb.Frame):
 		self.notebook.add(self, text="Editor") # Add itself to the notebook
 		self.session = requests.Session()
 		self.cb = contentbeautifier.ContentBeautifier()
+		self.bs = bodystore.BodyStore()
 		self.sts = scrolledtextsearch.ScrolledTextSearch("#DF352E")
 		self.hp = harparse.Harparse()
 		self.cm = contextmenu.ContextMenu()
@@ -225,10 +227,11 @@ class EditTab(tb.Frame):
 		if rowid:
 			self.request_id = rowid
 			self._clear_editor()
-			self.notebook.cursor.execute('''SELECT request_method, request_url, request_headers, request_body FROM transactions WHERE id = ?;''',(rowid,))
+			self.notebook.cursor.execute('''SELECT t.request_method, t.request_url, t.request_headers, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.request_body_hash WHERE t.id = ?;''',(rowid,))
 			row = self.notebook.cursor.fetchone()
 			if row:
 				method, url, headers, body = row
+				body = self.bs.decode(body)
 				if method:
 					self.method_label.config(text=method)
 				if url:
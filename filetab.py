@@ -1,7 +1,9 @@
 #! /usr/bin/env python3
 
 import os
+import queue
 import sqlite3
+import threading
 from tkinter import *
 import ttkbootstrap as tb
 from tkinter import filedialog
@@ -18,6 +20,8 @@ class FileTab(tb.Frame):
 		super().__init__(self.notebook)
 		self.notebook.add(self, text="File") # Add itself to the notebook
 		self.import_load = StringVar(value="import")
+		self.harfiles = []
+		self.import_queue = queue.Queue()
 		self._add_widgets()
 		self.hp = harparse.Harparse()
 
@@ -28,6 +32,8 @@ class FileTab(tb.Frame):
 		self._add_har_label_frame()
 		# Add import har radio button
 		self._add_har_radio()
+		# Add a toggle for compressed body storage
+		self._add_compress_toggle()
 		# Add a har text box label for the har file path entry
 		self._add_har_text_label()
 		# Add a har text entry for the file path
@@ -53,6 +59,10 @@ class FileTab(tb.Frame):
 		self._add_load_db_button()
 		# Add the main yellow button to perform the main form action
 		self._add_main_action_button()
+		# Add a label to report the result of an import
+		self._add_import_status_label()
+		# Add a table showing per-file import progress
+		self._add_import_progress_tree()
 
 	########################
 	### IMPORT HAR FRAME ###
@@ -68,6 +78,12 @@ class FileTab(tb.Frame):
 		self.load_har = tb.Radiobutton(self, variable=self.import_load, text="Import a HAR file to a new or existing database", value="import", command=self._enable_load_import_buttons, bootstyle="info")
 		self.load_har.place(relx=0.037, rely=0.05, relwidth=0.5, height=30)
 
+	def _add_compress_toggle(self) -> None:
+		'''Toggle compressed storage of bodies for newly created databases'''
+		self.compress_toggle_int = IntVar()
+		self.compress_toggle = tb.Checkbutton(self, text="Compress stored bodies (new databases)", variable=self.compress_toggle_int, style="info.Roundtoggle.Toolbutton")
+		self.compress_toggle.place(relx=0.55, rely=0.05, relwidth=0.4, height=30)
+
 	def _add_har_text_label(self) -> None:
 		'''Add a text label above the har file path text box'''
 		self.har_text_label = tb.Label(self, text="HAR File:")
@@ -81,7 +97,7 @@ class FileTab(tb.Frame):
 
 	def _add_har_button(self) -> None:
 		'''Add a button to select a har file to import'''
-		self.har_button = tb.Button(self, text="Select HAR", command=self._select_har, bootstyle="info", width=20)
+		self.har_button = tb.Button(self, text="Select HAR Files", command=self._select_har, bootstyle="info", width=20)
 		self.har_button.place(relx=0.804, rely=0.125, relwidth=0.16, height=30)
 
 	def _add_database_label(self) -> None:
@@ -123,13 +139,14 @@ class FileTab(tb.Frame):
 			self.db_text_entry.config(foreground="white")
 
 	def _select_har(self) -> None:
-		'''Use a file dialog to choose a har file to import'''
+		'''Use a file dialog to choose one or more har files to import'''
 		desktop = os.path.expanduser("~/Desktop")
-		harfile = filedialog.askopenfilename(initialdir=desktop, title="Select HAR file", filetypes=(("HAR files","*.har"),("All Files","*.*")))
-		if harfile:
+		harfiles = filedialog.askopenfilenames(initialdir=desktop, title="Select HAR files", filetypes=(("HAR files","*.har"),("All Files","*.*")))
+		if harfiles:
+			self.harfiles = list(harfiles)
 			self.har_text_entry.configure(state="normal")
 			self.har_text_entry.delete(0, 'end')
-			self.har_text_entry.insert(END, harfile)
+			self.har_text_entry.insert(END, "; ".join(self.harfiles))
 			self.har_text_entry.configure(state="disabled")
 
 	def _select_db(self) -> None:
@@ -177,6 +194,22 @@ class FileTab(tb.Frame):
 		self.load_button = tb.Button(self, text="Proceed", bootstyle="warning", command=self._load_file, width=20)
 		self.load_button.place(relx=0.5-0.08, rely=0.532, relwidth=0.16, height=30)
 
+	def _add_import_status_label(self) -> None:
+		'''Add a label below the main button for import results'''
+		self.import_status_label = tb.Label(self, text="", anchor="center")
+		self.import_status_label.place(relx=0.013, rely=0.58, relwidth=0.974, height=30)
+
+	def _add_import_progress_tree(self) -> None:
+		'''Add a table listing each HAR file being imported'''
+		self.import_tree = tb.Treeview(self, bootstyle="info", columns=("entries", "status"), show="tree headings")
+		self.import_tree.heading("#0", text="HAR File")
+		self.import_tree.heading("entries", text="Entries")
+		self.import_tree.heading("status", text="Status")
+		self.import_tree.column("#0", stretch=True)
+		self.import_tree.column("entries", width=120, stretch=False)
+		self.import_tree.column("status", width=300, stretch=False)
+		self.import_tree.place(relx=0.013, rely=0.625, relwidth=0.974, relheight=0.36)
+
 	def _select_db_load(self) -> None:
 		'''Use a file dialog to select a database to load'''
 		db_load = filedialog.askopenfilename(initialdir="~/Desktop", title="Select Database", filetypes=(("DB files","*.db"),))
@@ -188,30 +221,83 @@ class FileTab(tb.Frame):
 
 	def _load_file(self) -> None:
 		'''Load the selected file'''
-		ready = False
 		radio_value = self.import_load.get()
 		if radio_value == "load":
 			path = self.db_load_text_entry.get()
 			if path:
 				for i in self.notebook.window.tree_view.tree.get_children():
 					self.notebook.window.tree_view.tree.delete(i)
-				self.notebook.conn = sqlite3.connect(path, check_same_thread=False)
-				self.notebook.cursor = self.notebook.conn.cursor()
-				ready = True
+				self._open_database(path)
 		else:
-			harfile = self.har_text_entry.get()
 			dbfile = self.db_text_entry.get()
-			if harfile and dbfile:
-				self.hp.parse(harfile, dbfile)
-				self.notebook.conn = sqlite3.connect(dbfile, check_same_thread=False)
-				self.notebook.cursor = self.notebook.conn.cursor()
-				ready = True
-		if ready:
-			# Load the fuzz table
-			self.notebook.window.fuzz_tab._load_table()
-			# Load the table view
-			self.notebook.window.history_view._load_table()
-			# Load the tree view
-			self.notebook.window.tree_view._populate_treeview()
-			self.notebook.select(1)
+			if self.harfiles and dbfile:
+				self._start_import(self.harfiles, dbfile)
+
+	def _start_import(self, harfiles: list, dbfile: str) -> None:
+		'''Import HAR files on a background thread so the GUI stays responsive'''
+		self.load_button.config(bootstyle="secondary", state="disabled")
+		if self.compress_toggle_int.get() == 1:
+			self.hp.bs.compression = self.hp.bs.best_compression()
+		else:
+			self.hp.bs.compression = "none"
+		self.import_status_label.config(text=f"Importing {len(harfiles)} HAR file(s)...")
+		for item in self.import_tree.get_children():
+			self.import_tree.delete(item)
+		for harfile in harfiles:
+			self.import_tree.insert("", "end", iid=harfile, text=harfile, values=(0, "queued"))
+		t = threading.Thread(target=self._import_hars, args=(list(harfiles), dbfile))
+		t.daemon = True
+		t.start()
+		self.after(100, self._poll_import)
+
+	def _import_hars(self, harfiles: list, dbfile: str) -> None:
+		'''Run the multi-file import, passing progress back through the import queue'''
+		try:
+			stats = self.hp.parse_many(harfiles, dbfile, progress=self._queue_import_progress)
+			self.import_queue.put(("finished", dbfile, stats))
+		except Exception as e:
+			self.import_queue.put(("failed", dbfile, str(e)))
+
+	def _queue_import_progress(self, harfile: str, rows: int, done: bool, error: str) -> None:
+		'''Forward per-file progress to the Tk thread'''
+		self.import_queue.put(("progress", harfile, (rows, done, error)))
+
+	def _poll_import(self) -> None:
+		'''Apply queued import progress on the Tk thread until the import finishes'''
+		while 1:
+			try:
+				kind, target, info = self.import_queue.get_nowait()
+			except queue.Empty:
+				break
+			if kind == "progress":
+				rows, done, error = info
+				if error:
+					status = "error: " + error
+				elif done:
+					status = "done"
+				else:
+					status = "importing"
+				if self.import_tree.exists(target):
+					self.import_tree.item(target, values=(rows, status))
+			else:
+				self.load_button.config(bootstyle="warning", state="normal")
+				if kind == "finished":
+					self.import_status_label.config(text=f"Imported {info['rows']} entries in {info['seconds']}s ({info['rows_per_sec']} rows/s)")
+					self._open_database(target)
+				else:
+					self.import_status_label.config(text="Import failed: " + info)
+				return
+		self.after(100, self._poll_import)
 
+	def _open_database(self, path: str) -> None:
+		'''Connect to a database and load every tab from it'''
+		self.hp._migrate_db(path)
+		self.notebook.conn = sqlite3.connect(path, check_same_thread=False)
+		self.notebook.cursor = self.notebook.conn.cursor()
+		# Load the fuzz table
+		self.notebook.window.fuzz_tab._load_table()
+		# Load the table view
+		self.notebook.window.history_view._load_table()
+		# Load the tree view
+		self.notebook.window.tree_view._populate_treeview()
+		self.notebook.select(1)
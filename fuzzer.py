@@ -1,15 +1,25 @@
 #! /usr/bin/env python3
 
-import re
+import os
 import json
+import base64
 import time
 import queue
 import urllib
 import sqlite3
 import requests
 import datetime
-import itertools
+import fuzzrules
 import threading
+import baseline
+import bodystore
+import searchindex
+import asyncfuzzer
+import ratecontrol
+import reflection
+import payloadsource
+import requesttemplate
+import responsecluster
 import contentbeautifier
 
 class Fuzzer:
@@ -21,12 +31,48 @@ class Fuzzer:
 		self.threads = 4
 		self.delay = 0
 		self.request_queue = queue.Queue(maxsize=100)
+		# Bounded so a stalled disk slows the workers instead of filling memory
+		self.results_queue = queue.Queue(maxsize=10000)
+		# Rows written to the database, for the fuzzer tab to display on the Tk thread
+		self.ui_queue = queue.Queue()
+		self.batch_size = 200
+		self.commit_interval = 0.5
+		self.pool_maxsize = 0
+		self.pool_block = False
+		self.keep_alive = True
+		self.stats = {"connections": 0, "requests": 0}
+		self.handshakes = 0
+		self.rate_limit = 0
+		self.adaptive = False
+		self.bucket = ratecontrol.TokenBucket()
+		self.controller = None
 		self.session = requests.Session()
 		self.lock = threading.Lock()
 		self.cb = contentbeautifier.ContentBeautifier()
+		self.bs = bodystore.BodyStore()
+		self.si = searchindex.SearchIndex()
+		self.ra = reflection.ReflectionAnalyzer()
+		self.rc = responsecluster.ResponseClusterer()
+		# Unfuzzed requests sent before a run, the first only warms up the connection
+		self.baseline_requests = 4
+		self.baseline = baseline.Baseline()
+		self.rules = fuzzrules.FuzzRules()
+		self.payload_lengths = []
+		self.index_responses = False
 		self.num_of_payloads = 1
 		self.payload_idx = 0
+		# Position in the payload product to continue from, and positions after it already recorded
+		self.start_index = 0
+		self.skip_indexes = set()
+		self.error = ""
+		self.run_id = 0
 		self.is_running = False
+		self.engines = ["threads", "asyncio"]
+		# Cluster bomb tries every combination, sniper one position at a time, battering ram one payload everywhere, pitchfork the files side by side
+		self.attack_modes = ["cluster bomb", "sniper", "battering ram", "pitchfork"]
+		self.mode = "cluster bomb"
+		# Text each payload position replaced in the template, sniper leaves the other positions at these
+		self.originals = []
 		self.encoders = {
 			"url": self._format_url,
 			"json": self._format_json,
@@ -38,70 +84,201 @@ class Fuzzer:
 		}
 
 	def kill_fuzzer(self, conn) -> None:
-		'''Stop the current fuzzing'''
-		if self.is_running:
-			self.is_running = False
-			while 1:
-				try:
-					entry = self.request_queue.get(block=True, timeout=2)
-				except queue.Empty:
-					break
+		'''Stop the current fuzzing, workers and the request producer exit on their next check'''
+		self.is_running = False
 		conn.commit()
 
-	def _update_progress_bar(self, progress_bar) -> None:
-		'''Update the progress bar status'''
-		status = self.payload_idx / self.num_of_payloads
-		if status < 1.0:
-			progress_bar["value"] = status
+	def _build_session(self) -> requests.Session:
+		'''Return a session with connection pools sized for the concurrency, 0 sizes them to the thread count'''
+		session = requests.Session()
+		# Without enough pooled connections per host, threads open a new TCP/TLS connection for most requests
+		adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_maxsize or self.threads, pool_block=self.pool_block)
+		adapter.poolmanager.pool_classes_by_scheme = {scheme: self._counting_pool(pool_cls) for scheme, pool_cls in adapter.poolmanager.pool_classes_by_scheme.items()}
+		session.mount("http://", adapter)
+		session.mount("https://", adapter)
+		return session
+
+	def _counting_pool(self, pool_cls):
+		'''Return a pool class whose connections count every TCP/TLS handshake, including reconnects'''
+		fzr = self
+		class CountingConnection(pool_cls.ConnectionCls):
+			def connect(self) -> None:
+				with fzr.lock:
+					fzr.handshakes += 1
+				super().connect()
+		return type(pool_cls.__name__, (pool_cls,), {"ConnectionCls": CountingConnection})
+
+	def _connection_headers(self, headers: dict) -> dict:
+		'''Return request headers asking the server to close the connection when keep-alive is off'''
+		if self.keep_alive:
+			return headers
+		headers = {name: value for name, value in headers.items() if name.lower() != "connection"}
+		headers["Connection"] = "close"
+		return headers
+
+	def _session_stats(self) -> dict:
+		'''Return the connections opened and requests made by the session's pools'''
+		stats = {"connections": self.handshakes, "requests": 0}
+		adapters = set(self.session.adapters.values())
+		for adapter in adapters:
+			pools = adapter.poolmanager.pools
+			for key in pools.keys():
+				pool = pools.get(key)
+				if pool is not None:
+					stats["requests"] += pool.num_requests
+		return stats
+
+	def connection_stats(self) -> dict:
+		'''Return connection reuse counters of the last run'''
+		stats = dict(self.stats)
+		stats["reused"] = max(0, stats["requests"] - stats["connections"])
+		stats["reuse_rate"] = 0.0
+		if stats["requests"]:
+			stats["reuse_rate"] = round(stats["reused"] / stats["requests"] * 100, 1)
+		return stats
+
+	def _wait_for_slot(self) -> bool:
+		'''Block until the rules, the adaptive controller and the rate cap allow another request, False if the fuzzer stopped'''
+		while self.rules.pause_remaining():
+			if not self.is_running:
+				return False
+			time.sleep(min(0.5, self.rules.pause_remaining()))
+		if self.controller:
+			while not self.controller.acquire(timeout=0.5):
+				if not self.is_running:
+					return False
+		time.sleep(self.bucket.reserve())
+		return True
+
+	def _record_result(self, result: tuple) -> None:
+		'''Feed the outcome of a request back to the adaptive controller and the run's rules'''
+		results, raw_response, fingerprint = result
+		if self.controller:
+			self.controller.release(int(results[0]), float(results[1]), results[6] != "")
+		reason = self.rules.check(results[0], results[6], raw_response, fingerprint, self._position_group(results[10])[0])
+		if reason and self.is_running:
+			self.error = reason
+			self.is_running = False
+
+	def _position_group(self, index: int) -> tuple:
+		'''Return (group, first index, end index) of the run of requests in which only one position changes, group is -1 if there is none'''
+		if self.mode == "sniper":
+			start = 0
+			for position, length in enumerate(self.payload_lengths):
+				if index < start + length:
+					return (position, start, start + length)
+				start += length
+		elif self.mode == "cluster bomb" and self.payload_lengths:
+			# The last position varies fastest in product order
+			length = self.payload_lengths[-1]
+			group = index // length
+			return (group, group * length, (group + 1) * length)
+		return (-1, index, index + 1)
+
+	def rate_state(self) -> dict:
+		'''Return the adaptive concurrency limit and rate, empty if the run is not adaptive'''
+		if self.controller:
+			return self.controller.state()
+		return {}
 
 	def _load_payloads(self, file_paths: list) -> list:
-		'''Return a list of lists'''
-		self.num_of_payloads = 1
+		'''Return a payload file per position, lines are read from disk when a request needs them'''
 		self.payload_idx = 0
 		payloads = []
-		for path in file_paths:
-			payload_set = []
-			f = open(path,"r")
-			for line in f:
-				p = line.strip()
-				payload_set.append(p)
-			f.close()
-			self.num_of_payloads *= len(payload_set)
-			payloads.append(payload_set)
+		opened = {}
+		try:
+			for path in file_paths:
+				# Positions fuzzed with the same file share one mapping
+				if path not in opened:
+					opened[path] = payloadsource.PayloadFile(path)
+				payloads.append(opened[path])
+		except (OSError, ValueError):
+			self._close_payloads(payloads + list(opened.values()))
+			raise
+		self.num_of_payloads = self._count_requests(payloads)
+		self.payload_lengths = [len(payload_list) for payload_list in payloads]
 		return payloads
 
-	def _iter_format_payloads(self, template: str, payloads: list, encoding: str) -> str:
-		'''Load the queue with request data formatted with payloads'''
-		for payload_set in itertools.product(*payloads):
+	def _close_payloads(self, payloads: list) -> None:
+		'''Close the payload files of a run'''
+		for payload_file in set(payloads):
+			payload_file.close()
+
+	def _count_requests(self, payloads: list) -> int:
+		'''Return the number of requests the attack mode makes from the payload lists'''
+		if not payloads:
+			return 0
+		if self.mode == "sniper":
+			return sum(len(payload_list) for payload_list in payloads)
+		if self.mode == "battering ram":
+			return len(payloads[0])
+		if self.mode == "pitchfork":
+			return min(len(payload_list) for payload_list in payloads)
+		total = 1
+		for payload_list in payloads:
+			total *= len(payload_list)
+		return total
+
+	def _payload_set(self, payloads: list, index: int) -> tuple:
+		'''Return the combination of payloads at a position of the product, in itertools.product order'''
+		payload_set = []
+		# Mixed radix digits, the last payload set varies fastest
+		for payload_list in reversed(payloads):
+			index, digit = divmod(index, len(payload_list))
+			payload_set.append(payload_list[digit])
+		return tuple(reversed(payload_set))
+
+	def _template_values(self, payloads: list, index: int, encoding: str) -> tuple:
+		'''Return the values for every template position at a position of the attack and the payloads among them'''
+		if self.mode == "sniper":
+			# Positions take turns in order, each through its own payload file
+			position = 0
+			while index >= len(payloads[position]):
+				index -= len(payloads[position])
+				position += 1
+			payload = payloads[position][index]
+			values = [self.originals[i] if i < len(self.originals) else "" for i in range(len(payloads))]
+			values[position] = self._format_payloads((payload,), encoding)[0]
+			return (values, (payload,))
+		if self.mode == "battering ram":
+			payload = payloads[0][index]
+			return (self._format_payloads((payload,), encoding) * len(payloads), (payload,))
+		if self.mode == "pitchfork":
+			payload_set = tuple(payload_list[index] for payload_list in payloads)
+		else:
+			payload_set = self._payload_set(payloads, index)
+		return (self._format_payloads(payload_set, encoding), payload_set)
+
+	def _iter_requests(self, template: requesttemplate.RequestTemplate, payloads: list, encoding: str):
+		'''Yield request data filled with the payloads of each position of the attack not yet recorded or pruned'''
+		index = self.start_index
+		while index < self.num_of_payloads:
 			if not self.is_running:
 				break
-			formatted_payloads = self._format_payloads(payload_set, encoding)
-			formatted_request = template.format(*formatted_payloads)
-			lines = re.split(r"\r?\n", formatted_request)
-			if lines:
-				request_line = lines[0]
-				method, url, version = re.split(r"\s+", request_line)
-				headers = {}
-				for i in range(1, len(lines)):
-					if re.search(r":\s", lines[i]):
-						name, value = re.split(r":\s+", lines[i])
-						headers[name] = value
-					else:
-						break
-				body_lines = lines[i+1:]
-				body = ""
-				if body_lines:
-					body = "\n".join(body_lines)
-				self.request_queue.put(
-					{
-						"method": method,
-						"url": url,
-						"headers": headers,
-						"data": body,
-						"payloads": payload_set,
-						"raw_request": formatted_request
-					}
-				)
+			group, start, end = self._position_group(index)
+			if self.rules.is_pruned(group):
+				self.rules.count_pruned(end - index)
+				index = end
+				continue
+			if index in self.skip_indexes:
+				index += 1
+				continue
+			values, payload_set = self._template_values(payloads, index, encoding)
+			req_data = template.fill(values)
+			req_data["payloads"] = payload_set
+			req_data["payload_index"] = index
+			index += 1
+			yield req_data
+
+	def _iter_format_payloads(self, template: requesttemplate.RequestTemplate, payloads: list, encoding: str) -> None:
+		'''Load the queue with request data formatted with payloads'''
+		for req_data in self._iter_requests(template, payloads, encoding):
+			while self.is_running:
+				try:
+					self.request_queue.put(req_data, timeout=0.5)
+					break
+				except queue.Full:
+					pass
 
 	def _format_payloads(self, payloads: tuple, encoding: str) -> list:
 		'''Return a list of formatted payloads'''
@@ -144,7 +321,7 @@ class Fuzzer:
 		'''Return the original payload without encoding'''
 		return payload
 
-	def _send_request(self, cursor: sqlite3.Cursor, progress_bar, fuzz_table) -> None:
+	def _send_request(self) -> None:
 		'''Get request data from the queue and send it'''
 		queue_timeout = 2
 		while self.is_running:
@@ -152,30 +329,28 @@ class Fuzzer:
 				# Prepare variables for results
 				error = ""
 				req_data = self.request_queue.get(block=True, timeout=queue_timeout)
-				status_code = "000"
-				rtt = "0.0"
-				timestamp = "0000-00-00 00:00:00"
-				content_length = "0"
-				reflected = "N"
-				payloads = str(req_data["payloads"])
+				# Requests queued before their position was pruned
+				if self.rules.is_pruned(self._position_group(req_data["payload_index"])[0]):
+					self.rules.count_pruned(1)
+					continue
+				if not self._wait_for_slot():
+					break
 				timeout = "N"
-				raw_request = req_data["raw_request"]
-				raw_response = ""
-				success = False
+				r = None
 				# Make and time the request
+				t1 = time.time()
+				t2 = t1
 				try:
-					t1 = time.time()
 					r = self.session.request(
 						req_data["method"],
 						req_data["url"],
-						headers=req_data["headers"],
+						headers=self._connection_headers(req_data["headers"]),
 						data=req_data["data"],
 						timeout=self.timeout,
 						allow_redirects=False,
 						verify=False
 					)
 					t2 = time.time()
-					success = True
 				except requests.ConnectionError:
 					error = "Connection Error"
 				except requests.Timeout:
@@ -187,41 +362,132 @@ class Fuzzer:
 					error = "URL Error"
 				except:
 					error = "Generic Request Error"
-				# Post processing after the request if successful
-				if success:
-					timestamp = datetime.datetime.fromtimestamp(t1).strftime("%Y-%m-%d %H:%M:%S")
-					rtt = str(round(t2 - t1, 3))
-					status_code = str(r.status_code)
-					content_length = str(len(r.content))
-					for payload in req_data["payloads"]:
-						if bytes(payload,"utf-8") in r.content:
-							reflected = "Y"
-							break
-					raw_response = self.cb.rebuild_response_requests(r)
-				# Add request results to the database
-				results = (
-					status_code,
-					rtt,
-					content_length,
-					payloads,
-					reflected,
-					timeout,
-					error,
-					timestamp,
-					raw_request,
-					raw_response
-				)
-				self._add_to_db(cursor, results, progress_bar, fuzz_table)
+				results = self._result_row(req_data, r, t1, t2, error, timeout)
+				self._record_result(results)
+				self.results_queue.put(results)
 				time.sleep(self.delay)
 			except queue.Empty:
 				break
 
-	def _add_to_db(self, cursor: sqlite3.Cursor, results: tuple, progress_bar, fuzz_table) -> None:
-		'''Add results to the database. Update status bar and fuzz table.'''
-		self.lock.acquire()
-		self.payload_idx += 1
-		cursor.execute('''INSERT INTO fuzz 
-			(status_code,
+	def _payload_text(self, req_data: dict) -> str:
+		'''Return the payloads column of a request, sniper results also name the position that was fuzzed'''
+		if self.mode == "sniper":
+			position = self._position_group(req_data["payload_index"])[0]
+			return f"§{position}: {req_data['payloads'][0]}"
+		return str(req_data["payloads"])
+
+	def _result_row(self, req_data: dict, r, t1: float, t2: float, error: str, timeout: str) -> tuple:
+		'''Return the fuzz table row, raw response and response fingerprint for a request, r is None if the request failed'''
+		status_code = "000"
+		rtt = "0.0"
+		timestamp = "0000-00-00 00:00:00"
+		content_length = "0"
+		reflected = "N"
+		reflection = ""
+		raw_response = ""
+		fingerprint = self.rc.error_fingerprint(error)
+		deltas = self.baseline.error_deltas()
+		# Post processing after the request if successful
+		if r is not None:
+			timestamp = datetime.datetime.fromtimestamp(t1).strftime("%Y-%m-%d %H:%M:%S")
+			rtt = str(round(t2 - t1, 3))
+			status_code = str(r.status_code)
+			content_length = str(len(r.content))
+			# Raw, sent and escaped forms of every payload in one pass over the body
+			found = self.ra.scan(r.content, req_data["payloads"], tuple(self._format_payloads(req_data["payloads"], self.encoder)))
+			if found:
+				reflected = "Y"
+				reflection = f"{found[0]}@{found[2]}"
+			# Stored as received, the fuzzer tab beautifies a response when it is shown
+			raw_response = self.cb.rebuild_response_requests(r, beautify=False)
+			# Fingerprinted while the body is in memory so clustering never reads responses back
+			fingerprint = self.rc.fingerprint(status_code, r.headers, r.content, req_data["payloads"])
+			deltas = self.baseline.deltas(status_code, r.content, fingerprint[1], t2 - t1)
+		results = (
+			status_code,
+			rtt,
+			content_length,
+			self._payload_text(req_data),
+			reflected,
+			timeout,
+			error,
+			timestamp,
+			self.bs.encode(req_data["raw_request"]),
+			self.bs.encode(raw_response),
+			req_data["payload_index"],
+			reflection
+		) + deltas
+		return (results, raw_response, fingerprint)
+
+	def _database_path(self, conn: sqlite3.Connection) -> str:
+		'''Return the file of the main database, empty for an in-memory database'''
+		for seq, name, fpath in conn.execute('''PRAGMA database_list;''').fetchall():
+			if name == "main":
+				return fpath
+		return ""
+
+	def _write_results(self, dbpath: str, conn: sqlite3.Connection) -> None:
+		'''Drain the results queue into the database, committing every batch so a crash loses at most one'''
+		# The writer owns its connection so neither workers nor the GUI cursor wait on disk
+		if dbpath:
+			conn = sqlite3.connect(dbpath, timeout=30)
+		cursor = conn.cursor()
+		next_id = 0
+		done = False
+		failed = False
+		try:
+			try:
+				next_id = self.si.last_rowid(cursor, "fuzz") + 1
+				self.rc.load(cursor, self.run_id)
+			except sqlite3.Error as e:
+				failed = True
+				self.error = f"Result writer error: {e}"
+				self.is_running = False
+			while not done:
+				try:
+					item = self.results_queue.get(timeout=self.commit_interval)
+				except queue.Empty:
+					continue
+				# Fill the batch until it is full or the commit interval passes
+				batch = []
+				deadline = time.time() + self.commit_interval
+				while item is not None:
+					batch.append(item)
+					if len(batch) >= self.batch_size:
+						break
+					try:
+						item = self.results_queue.get(timeout=max(0, deadline - time.time()))
+					except queue.Empty:
+						break
+				done = item is None
+				if batch and not failed:
+					try:
+						next_id = self._insert_results(cursor, batch, next_id)
+						conn.commit()
+					except Exception as e:
+						# Stop the run but keep draining, workers and fuzz() block on a full queue
+						conn.rollback()
+						failed = True
+						self.error = f"Result writer error: {e}"
+						self.is_running = False
+		finally:
+			if dbpath:
+				conn.close()
+
+	def _insert_results(self, cursor: sqlite3.Cursor, batch: list, next_id: int) -> int:
+		'''Add a batch of results to the database and queue their table rows. Return the next id.'''
+		rows = []
+		indexed = []
+		# Ids are assigned here since the writer is the only one inserting and executemany has no lastrowid
+		for results, raw_response, fingerprint in batch:
+			cluster_id = self.rc.assign(fingerprint, next_id)
+			rows.append((next_id,) + results + (self.rc.to_signed(fingerprint[0]), cluster_id, self.run_id))
+			if self.index_responses:
+				indexed.append((next_id, self.si.searchable_text(raw_response)))
+			next_id += 1
+		cursor.executemany('''INSERT INTO fuzz 
+			(id,
+			status_code,
 			rtt,
 			content_length,
 			payloads,
@@ -230,31 +496,273 @@ class Fuzzer:
 			errors,
 			timestamp,
 			raw_request,
-			raw_response) VALUES (?,?,?,?,?,?,?,?,?,?);''', results)
-		self._update_progress_bar(progress_bar)
-		table_results = [self.payload_idx]
-		table_results.extend(results)
-		iid = fuzz_table.view.insert("", "end", values=table_results) # Enables better updating, but not clicking/filtering
-		fuzz_table.view.update()
-		#fuzz_table.insert_row("end", values=table_results) # Enables clicking/filtering, but does not update cleanly with load_table_data()
-		#fuzz_table.load_table_data() # not good to call often
-		self.lock.release()
-
-	def _clear_fuzz_table(self, cursor: sqlite3.Cursor, conn: sqlite3.Connection) -> None:
-		'''Clear the fuzz results table'''
-		cursor.execute('''DELETE FROM fuzz;''')
-		cursor.execute('''UPDATE SQLITE_SEQUENCE SET seq=0 WHERE name='fuzz';''')
+			raw_response,
+			payload_index,
+			reflection,
+			status_changed,
+			length_delta,
+			word_delta,
+			line_delta,
+			rtt_z,
+			structure_delta,
+			simhash,
+			cluster_id,
+			run_id) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);''', rows)
+		if indexed:
+			self.si.index_fuzz(cursor, indexed)
+		self.rc.save(cursor)
+		# Checkpoint in the same transaction as the rows it counts
+		cursor.execute('''UPDATE fuzz_runs SET completed = completed + ? WHERE id = ?;''', (len(batch), self.run_id))
+		self.payload_idx += len(batch)
+		self.ui_queue.put([row[:9] + (row[12], row[20]) for row in rows])
+		return next_id
+
+	def _payload_stats(self, file_paths: list) -> list:
+		'''Return [size, modification time in ns] of each payload file, to tell an edited file from the one a run started with'''
+		stats = []
+		for path in file_paths:
+			st = os.stat(path)
+			stats.append([st.st_size, st.st_mtime_ns])
+		return stats
+
+	def _same_payload_files(self, file_paths: list, saved: list) -> bool:
+		'''Return True if the payload files are unchanged since a run saved their stats, runs saved without them are trusted'''
+		if saved is None:
+			return True
+		try:
+			return self._payload_stats(file_paths) == saved
+		except OSError:
+			return False
+
+	def _create_run(self, cursor: sqlite3.Cursor, template: str, file_paths: list, encoder: str, settings: dict, source_id: int) -> int:
+		'''Record what a new run fuzzes and with which settings, return its id'''
+		cursor.execute('''INSERT INTO fuzz_runs (template, payload_files, encoder, settings, source_id, total, completed, finished, started, ended) VALUES (?,?,?,?,?,?,0,0,?,'');''', (
+			template,
+			json.dumps(file_paths),
+			encoder,
+			json.dumps(settings),
+			source_id,
+			self.num_of_payloads,
+			datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+		))
+		return cursor.lastrowid
+
+	def list_runs(self, cursor: sqlite3.Cursor) -> list:
+		'''Return (id, started, template, total, completed, finished) for every run, newest first'''
+		cursor.execute('''SELECT id, started, template, total, completed, finished FROM fuzz_runs ORDER BY id DESC;''')
+		return cursor.fetchall()
+
+	def load_state(self, cursor: sqlite3.Cursor, run_id: int) -> dict:
+		'''Return the template, payload files, encoder and attack mode of an unfinished run, empty if it finished'''
+		cursor.execute('''SELECT template, payload_files, encoder, settings, source_id, total, completed FROM fuzz_runs WHERE id = ? AND finished = 0;''', (run_id,))
+		row = cursor.fetchone()
+		if not row:
+			return {}
+		template, payload_files, encoder, settings, source_id, total, completed = row
+		settings = json.loads(settings or "{}")
+		return {
+			"template": template,
+			"file_paths": json.loads(payload_files),
+			"encoder": encoder,
+			"mode": settings.get("mode", "cluster bomb"),
+			"originals": settings.get("originals", []),
+			"rules": settings.get("rules", ""),
+			"payload_stats": settings.get("payload_stats"),
+			"source_id": source_id or 0,
+			"total": total,
+			"completed": completed
+		}
+
+	def delete_run(self, conn: sqlite3.Connection, run_id: int) -> None:
+		'''Delete a run and its results'''
+		cursor = conn.cursor()
+		if self.si.available(cursor):
+			after_id = 0
+			while 1:
+				rows = cursor.execute('''SELECT id, raw_response FROM fuzz WHERE run_id = ? AND id > ? ORDER BY id LIMIT 500;''', (run_id, after_id)).fetchall()
+				if not rows:
+					break
+				self.si.delete_fuzz(cursor, [(rowid, self.si.searchable_text(raw_response)) for rowid, raw_response in rows])
+				after_id = rows[-1][0]
+		cursor.execute('''DELETE FROM fuzz WHERE run_id = ?;''', (run_id,))
+		self.rc.delete_run(cursor, run_id)
+		cursor.execute('''DELETE FROM fuzz_runs WHERE id = ?;''', (run_id,))
 		conn.commit()
 
-	def fuzz(self, template: str, file_paths: list, encoder: str, timeout: int, threads: int, delay: int, conn: sqlite3.Connection, cursor: sqlite3.Cursor, progress_bar, fuzz_table) -> None:
-		'''Fuzz the target application and add results to the database'''
-		self._clear_fuzz_table(cursor, conn)
+	def _resume_point(self, cursor: sqlite3.Cursor) -> tuple:
+		'''Return the first payload index of the run without a result and the recorded indexes after it'''
+		start = 0
+		skip = set()
+		cursor.execute('''SELECT payload_index FROM fuzz WHERE run_id = ? AND payload_index IS NOT NULL ORDER BY payload_index;''', (self.run_id,))
+		while 1:
+			rows = cursor.fetchmany(10000)
+			if not rows:
+				break
+			# Only results that were in flight when the run stopped land after the first gap
+			for (index,) in rows:
+				if index == start and not skip:
+					start += 1
+				elif index >= start:
+					skip.add(index)
+		return (start, skip)
+
+	def fuzz(self, template: str, file_paths: list, encoder: str, timeout: int, threads: int, delay: int, conn: sqlite3.Connection, cursor: sqlite3.Cursor, engine: str="threads", pool_maxsize: int=0, pool_block: bool=False, keep_alive: bool=True, rate_limit: int=0, adaptive: bool=False, resume_run: int=0, mode: str="cluster bomb", originals: list=None, source_id: int=0, rules: str="") -> None:
+		'''Fuzz the target application as a new run, or continue resume_run, threads is the concurrency of either engine'''
+		self.error = ""
 		self.is_running = True
+		# The run owns its connection, the GUI keeps querying its own cursor while the run goes on
+		dbpath = self._database_path(conn)
+		if dbpath:
+			conn = sqlite3.connect(dbpath, timeout=30)
+		cursor = conn.cursor()
+		try:
+			self._fuzz_run(template, file_paths, encoder, timeout, threads, delay, conn, cursor, dbpath, engine, pool_maxsize, pool_block, keep_alive, rate_limit, adaptive, resume_run, mode, originals, source_id, rules)
+		except sqlite3.Error as e:
+			self.error = f"Database error: {e}"
+		finally:
+			self.is_running = False
+			if dbpath:
+				conn.close()
+
+	def _fuzz_run(self, template: str, file_paths: list, encoder: str, timeout: int, threads: int, delay: int, conn: sqlite3.Connection, cursor: sqlite3.Cursor, dbpath: str, engine: str, pool_maxsize: int, pool_block: bool, keep_alive: bool, rate_limit: int, adaptive: bool, resume_run: int, mode: str, originals: list, source_id: int, rules: str) -> None:
+		'''Load, send and record one run on the fuzz thread's connection'''
+		self.mode = mode if mode in self.attack_modes else "cluster bomb"
+		self.originals = list(originals or [])
+		try:
+			payloads = self._load_payloads(file_paths)
+		except (OSError, ValueError) as e:
+			self.error = f"Payload file error: {e}"
+			self.is_running = False
+			return
+		try:
+			self.rules = fuzzrules.FuzzRules(rules)
+		except ValueError as e:
+			self.error = f"Rule error: {e}"
+			self.is_running = False
+			self._close_payloads(payloads)
+			return
+		try:
+			request_template = requesttemplate.RequestTemplate(template)
+			if request_template.num_of_slots > len(payloads):
+				raise ValueError("More payload positions than payload files")
+		except ValueError as e:
+			self.error = f"Request template error: {e}"
+			self.is_running = False
+			self._close_payloads(payloads)
+			return
+		if resume_run:
+			state = self.load_state(cursor, resume_run)
+			# Positions only line up with the same payload files and attack mode
+			if not state or state["mode"] != self.mode or state["total"] != self.num_of_payloads or not self._same_payload_files(file_paths, state["payload_stats"]):
+				self.error = "Payload files changed since the run was saved"
+				self.is_running = False
+				self._close_payloads(payloads)
+				return
+			self.run_id = resume_run
+			self.start_index, self.skip_indexes = self._resume_point(cursor)
+			self.payload_idx = self.start_index + len(self.skip_indexes)
+		else:
+			self.start_index = 0
+			self.skip_indexes = set()
+			settings = {
+				"engine": engine,
+				"threads": threads,
+				"timeout": timeout,
+				"delay": delay,
+				"pool_maxsize": pool_maxsize,
+				"pool_block": pool_block,
+				"keep_alive": keep_alive,
+				"rate_limit": rate_limit,
+				"adaptive": adaptive,
+				"mode": self.mode,
+				"originals": self.originals,
+				"rules": rules,
+				"payload_stats": self._payload_stats(file_paths)
+			}
+			self.run_id = self._create_run(cursor, template, file_paths, encoder, settings, source_id)
+			conn.commit()
+		# Store raw requests and responses the same way as the database's bodies
+		self.bs.load_settings(cursor)
+		self.index_responses = self.si.available(cursor)
 		self.encoder = encoder
 		self.timeout = timeout
 		self.threads = threads
 		self.delay = delay
-		payloads = self._load_payloads(file_paths)
+		self.pool_maxsize = pool_maxsize
+		self.pool_block = pool_block
+		self.keep_alive = keep_alive
+		self.rate_limit = rate_limit
+		self.adaptive = adaptive
+		# One bucket caps requests per second across every worker of either engine
+		self.bucket = ratecontrol.TokenBucket(rate_limit)
+		self.controller = None
+		if adaptive:
+			# Concurrency ramps up to the threads setting and backs off on throttling
+			self.controller = ratecontrol.AIMDController(self.threads, self.bucket, max_rate=rate_limit)
+		# Measured again on resume, the target may have changed since the run stopped
+		self.baseline = self._measure_baseline(request_template, cursor, source_id)
+		# Fresh queues so nothing left by a stopped run is sent or written
+		self.request_queue = queue.Queue(maxsize=self.request_queue.maxsize)
+		self.results_queue = queue.Queue(maxsize=self.results_queue.maxsize)
+		writer = threading.Thread(target=self._write_results, args=(dbpath, conn))
+		writer.daemon = True
+		writer.start()
+		finished = False
+		try:
+			if engine == "asyncio":
+				# One event loop keeps every request in flight over pooled keep-alive connections
+				af = asyncfuzzer.AsyncFuzzer(self)
+				af.run(self._iter_requests(request_template, payloads, self.encoder))
+				self.stats = {"connections": af.num_connections, "requests": af.num_requests}
+			else:
+				# A fresh session per run so its pools match the settings and counters start at zero
+				self.session.close()
+				self.handshakes = 0
+				self.session = self._build_session()
+				self._run_threads(request_template, payloads)
+				self.stats = self._session_stats()
+			finished = self.is_running
+		finally:
+			# Let the writer flush what is left, it drains the queue even after a failed write
+			self.is_running = False
+			self.results_queue.put(None)
+			writer.join()
+			self._close_payloads(payloads)
+			# A stopped run stays resumable
+			cursor.execute('''UPDATE fuzz_runs SET finished = ?, ended = ? WHERE id = ?;''', (1 if finished else 0, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.run_id))
+			conn.commit()
+
+	def _measure_baseline(self, template: requesttemplate.RequestTemplate, cursor: sqlite3.Cursor, source_id: int) -> baseline.Baseline:
+		'''Return the baseline of the request without payloads, falling back to the captured response of the source transaction'''
+		bl = baseline.Baseline()
+		values = [self.originals[i] if i < len(self.originals) else "" for i in range(template.num_of_slots)]
+		req_data = template.fill(values)
+		session = requests.Session()
+		for i in range(self.baseline_requests):
+			if not self.is_running:
+				break
+			t1 = time.time()
+			try:
+				r = session.request(
+					req_data["method"],
+					req_data["url"],
+					headers=req_data["headers"],
+					data=req_data["data"],
+					timeout=self.timeout,
+					allow_redirects=False,
+					verify=False
+				)
+			except requests.RequestException:
+				continue
+			# The first round trip includes the handshake
+			bl.add(str(r.status_code), r.content, time.time() - t1 if i else None)
+		session.close()
+		if bl.is_empty() and source_id:
+			bl.add_transaction(cursor, source_id)
+		return bl
+
+	def _run_threads(self, template: requesttemplate.RequestTemplate, payloads: list) -> None:
+		'''Send requests from a pool of threads sharing one session'''
 		threads = []
 		# Create thread that loads the queue for requests to pull on the fly
 		t = threading.Thread(target=self._iter_format_payloads, args=(template, payloads, self.encoder))
@@ -263,17 +771,12 @@ class Fuzzer:
 		threads.append(t)
 		# Create threads to make requests
 		for i in range(0,self.threads):
-			t = threading.Thread(target=self._send_request, args=(cursor, progress_bar, fuzz_table))
+			t = threading.Thread(target=self._send_request, args=())
 			t.daemon = True
 			t.start()
 			threads.append(t)
 		# Wait for all threads to finish
 		for t in threads:
 			t.join()
-		progress_bar["value"] = 1.0
-		progress_bar.config(bootstyle="danger")
-		self.is_running = False
-		# Commit database writes made by request threads
-		conn.commit()
 
 
@@ -0,0 +1,115 @@
+#! /usr/bin/env python3
+
+import re
+import time
+import threading
+from collections import deque
+
+class FuzzRules:
+
+	def __init__(self, text: str="") -> None:
+		'''Initialize stop, prune and pause rules from one rule per line, see parse for the syntax'''
+		self.lock = threading.Lock()
+		self.text = text
+		self.rules = self.parse(text)
+		self.max_distance = 3
+		self.stop_reason = ""
+		self.consecutive_errors = 0
+		self.throttled = {}
+		self.paused_until = 0.0
+		self.groups = {}
+		self.pruned = set()
+		self.num_pruned = 0
+
+	# Rule syntax, one per line, lines starting with # are ignored:
+	#   stop errors 20        stop after 20 connection errors or timeouts in a row
+	#   stop match <regex>    stop when a response matches a regular expression
+	#   prune identical 50    skip the rest of a position after 50 identical responses in a row
+	#   pause 429 10 5 30     pause 30 seconds when 10 responses within 5 seconds are 429s
+	def parse(self, text: str) -> list:
+		'''Return the rules in a text, raise ValueError for a line that is not a rule'''
+		rules = []
+		for line in text.splitlines():
+			line = line.strip()
+			if not line or line.startswith("#"):
+				continue
+			words = line.split()
+			try:
+				if words[:2] == ["stop", "errors"] and len(words) == 3:
+					rules.append({"rule": "stop_errors", "count": max(1, int(words[2]))})
+				elif words[:2] == ["stop", "match"] and len(words) > 2:
+					pattern = line.split(None, 2)[2]
+					rules.append({"rule": "stop_match", "pattern": re.compile(pattern), "text": pattern})
+				elif words[:2] == ["prune", "identical"] and len(words) == 3:
+					rules.append({"rule": "prune_identical", "count": max(2, int(words[2]))})
+				elif words[0] == "pause" and len(words) == 5:
+					status_code, count, window, pause = words[1:]
+					rules.append({"rule": "pause", "status_code": str(int(status_code)), "count": max(1, int(count)), "window": float(window), "pause": float(pause)})
+				else:
+					raise ValueError(f"Unknown rule: {line}")
+			except re.error as e:
+				raise ValueError(f"Bad pattern in rule: {line} ({e})")
+			except (ValueError, IndexError):
+				raise ValueError(f"Bad rule: {line}")
+		return rules
+
+	def pause_remaining(self) -> float:
+		'''Return the seconds left in a pause, 0 if requests may be sent'''
+		return max(0.0, self.paused_until - time.monotonic())
+
+	def is_pruned(self, group: int) -> bool:
+		'''Return True if the rest of a position was skipped'''
+		return group in self.pruned
+
+	def count_pruned(self, num: int) -> None:
+		'''Count requests skipped by pruning'''
+		with self.lock:
+			self.num_pruned += num
+
+	def check(self, status_code: str, error: str, raw_response: str, fingerprint: tuple, group: int) -> str:
+		'''Apply the rules to a result and return why the run should stop, empty to continue'''
+		if not self.rules:
+			return ""
+		with self.lock:
+			for rule in self.rules:
+				name = rule["rule"]
+				if name == "stop_errors":
+					self.consecutive_errors = self.consecutive_errors + 1 if error else 0
+					if self.consecutive_errors >= rule["count"]:
+						self.stop_reason = f"Stopped after {self.consecutive_errors} errors in a row"
+				elif name == "stop_match":
+					if raw_response and rule["pattern"].search(raw_response):
+						self.stop_reason = f"Stopped on a response matching {rule['text']}"
+				elif name == "pause":
+					if status_code == rule["status_code"]:
+						self._count_throttled(rule)
+				elif name == "prune_identical" and not error:
+					self._count_identical(rule, fingerprint, group)
+			return self.stop_reason
+
+	def _count_throttled(self, rule: dict) -> None:
+		'''Pause when enough throttling responses arrive within the rule's window'''
+		now = time.monotonic()
+		times = self.throttled.setdefault(id(rule), deque())
+		times.append(now)
+		while times and now - times[0] > rule["window"]:
+			times.popleft()
+		if len(times) >= rule["count"]:
+			self.paused_until = max(self.paused_until, now + rule["pause"])
+			times.clear()
+
+	def _count_identical(self, rule: dict, fingerprint: tuple, group: int) -> None:
+		'''Prune a position once its responses stop changing'''
+		if group < 0 or group in self.pruned:
+			return
+		simhash, word_count, header_key = fingerprint
+		state = self.groups.get(group)
+		# Near identical like clustering, so timestamps or tokens in a page do not reset the streak
+		if state and state[2] == header_key and state[1] == word_count and bin(state[0] ^ simhash).count("1") <= self.max_distance:
+			state[3] += 1
+		else:
+			state = [simhash, word_count, header_key, 1]
+			self.groups[group] = state
+		if state[3] >= rule["count"]:
+			self.pruned.add(group)
+			del self.groups[group]
@@ -1,9 +1,13 @@
 #! /usr/bin/env python3
 
 import os
+import time
+import queue
 import fuzzer
+import fuzzrules
 import threading
 import selectpayloads
+import bodystore
 import contentbeautifier
 import scrolledtextsearch
 import contextmenu
@@ -29,6 +33,7 @@ class FuzzTab(tb.Frame):
 		self.notebook.add(self, text="Fuzzer") # Add itself to the notebook
 		self.fzr = fuzzer.Fuzzer()
 		self.cb = contentbeautifier.ContentBeautifier()
+		self.bs = bodystore.BodyStore()
 		self.sp = selectpayloads.SelectPayloads()
 		self.sts = scrolledtextsearch.ScrolledTextSearch("#35B279")
 		self.selected_pane = 0
@@ -43,10 +48,27 @@ class FuzzTab(tb.Frame):
 			{"text":"reflected","stretch":False},
 			{"text":"timeout","stretch":False},
 			{"text":"errors","stretch":False},
-			{"text":"timestamp","stretch":False}
+			{"text":"timestamp","stretch":False},
+			{"text":"reflection","stretch":False},
+			{"text":"cluster","stretch":False}
 		]
 		self.cm = contextmenu.ContextMenu()
 		self.request_id = -1
+		self.fuzz_thread = None
+		self.selected_run = 0
+		self.fuzz_counts = {}
+		# Results are drawn about 20 times a second, counters a few times a second
+		self.frame_ms = 50
+		self.max_rows_per_frame = 500
+		self.refresh_interval = 0.25
+		# The cluster view is rebuilt from the database about once a second during a run
+		self.cluster_refresh_interval = 1.0
+		self.max_cluster_rows = 1000
+		# Responses with bodies larger than this are beautified in a thread after showing them as stored
+		self.inline_beautify_size = 64 * 1024
+		self.beautified_queue = queue.Queue()
+		# Stop, prune and pause rules for the next run, one per line
+		self.rules_text = ""
 		self._add_widgets()
 
 	def _add_widgets(self) -> None:
@@ -57,6 +79,10 @@ class FuzzTab(tb.Frame):
 		self._add_config_button()
 		# Add the results button for the results pane
 		self._add_results_button()
+		# Add a label for connection reuse counters
+		self._add_connection_stats_label()
+		# Add a label for the counters of the current run
+		self._add_fuzz_counts_label()
 		# Add the config frame
 		self._add_config_frame()
 		# Add the results frame
@@ -75,6 +101,16 @@ class FuzzTab(tb.Frame):
 		self.label_frame = tb.Labelframe(self, bootstyle="info")
 		self.label_frame.place(relx=0.013, rely=0.03, relwidth=0.974, relheight=0.925)
 
+	def _add_connection_stats_label(self) -> None:
+		'''Add a label for the connection reuse of the last run'''
+		self.connection_stats_label = tb.Label(self, text="")
+		self.connection_stats_label.place(in_=self.results_button, relx=1.0, rely=0, x=15, width=500, height=30)
+
+	def _add_fuzz_counts_label(self) -> None:
+		'''Add a label for requests sent, rate, errors and reflections'''
+		self.fuzz_counts_label = tb.Label(self, text="")
+		self.fuzz_counts_label.place(in_=self.connection_stats_label, relx=1.0, rely=0, x=10, width=520, height=30)
+
 	def _add_config_button(self) -> None:
 		'''Add a button to select the config pane'''
 		self.config_button = tb.Button(self, text="Configure", command=lambda:self._switch_pane(0), bootstyle="info")
@@ -102,6 +138,14 @@ class FuzzTab(tb.Frame):
 		self._add_encoder_label(self.config_frame)
 		# Add a selection combobox for encoders
 		self._add_encoder_combobox(self.config_frame)
+		# Add a menu for the attack mode
+		self._add_mode_menu(self.config_frame)
+		# Add a button to edit the run's stop, prune and pause rules
+		self._add_rules_button(self.config_frame)
+		# Add a spinbox for the requests per second cap
+		self._add_rate_limit_spinbox(self.config_frame)
+		# Add a toggle for adaptive concurrency and rate
+		self._add_adaptive_toggle(self.config_frame)
 		# Add a meter to control the delay between requests
 		self._add_delay_meter(self.config_frame)
 		# Add a meter to control the number of threads
@@ -114,6 +158,16 @@ class FuzzTab(tb.Frame):
 		self._add_fuzz_button(self.config_frame)
 		# Add the button to stop fuzzing
 		self._add_stop_button(self.config_frame)
+		# Add the button to resume a stopped run
+		self._add_resume_button(self.config_frame)
+		# Add a toggle to select the asyncio engine
+		self._add_engine_toggle(self.config_frame)
+		# Add a toggle to keep connections alive
+		self._add_keep_alive_toggle(self.config_frame)
+		# Add a toggle to block on a full connection pool
+		self._add_pool_block_toggle(self.config_frame)
+		# Add a spinbox for the connection pool size per host
+		self._add_pool_size_spinbox(self.config_frame)
 		# Place the frame
 		self.config_frame.place(relx=0.018, rely=0.07, relwidth=0.9635, relheight=0.876)
 
@@ -157,6 +211,83 @@ class FuzzTab(tb.Frame):
 		enc = self.enc_str.get()
 		self.mb_encoders.config(text=enc)
 
+	def _add_mode_menu(self, parent_frame) -> None:
+		'''Add a menu for how payload files are combined across positions'''
+		self.mode_label = tb.Label(parent_frame, text="Attack:")
+		self.mode_label.place(in_=self.enc_label, relx=1.0, rely=0, x=10, width=50, height=30)
+		self.mb_modes = tb.Menubutton(parent_frame, text=self.fzr.attack_modes[0], bootstyle="secondary")
+		self.mb_modes.place(in_=self.mode_label, relx=1.0, rely=0, width=140, height=30)
+		self.mode_menu = tb.Menu(self.mb_modes)
+		self.mode_str = StringVar()
+		self.mode_str.set(self.fzr.attack_modes[0])
+		for opt in self.fzr.attack_modes:
+			self.mode_menu.add_radiobutton(label=opt, variable=self.mode_str, command=self._click_mode)
+		self.mb_modes['menu'] = self.mode_menu
+
+	def _click_mode(self) -> None:
+		'''Click an attack mode option on the menu'''
+		self.mb_modes.config(text=self.mode_str.get())
+
+	def _add_rules_button(self, parent_frame) -> None:
+		'''Add a button to edit rules that stop, prune or pause a run'''
+		self.rules_button = tb.Button(parent_frame, text="Rules", command=self._edit_rules, bootstyle="secondary outline")
+		self.rules_button.place(in_=self.mb_modes, relx=1.0, rely=0, x=10, width=90, height=30)
+
+	def _edit_rules(self) -> None:
+		'''Open a window to edit the rules of the next run'''
+		window = tb.Toplevel(title="Fuzz Rules")
+		window.geometry("560x300")
+		rules_textbox = ScrolledText(window, bootstyle="info round", wrap=WORD, hbar=True)
+		rules_textbox.place(relx=0.02, rely=0.03, relwidth=0.96, relheight=0.78)
+		if self.rules_text:
+			rules_textbox.insert(END, self.rules_text)
+		else:
+			rules_textbox.insert(END, "# stop errors 20\n# stop match (?i)sql syntax\n# prune identical 50\n# pause 429 10 5 30\n")
+		status_label = tb.Label(window, text="")
+		status_label.place(relx=0.02, rely=0.85, relwidth=0.75, height=30)
+		save_button = tb.Button(window, text="Save", command=lambda:self._save_rules(window, rules_textbox, status_label), bootstyle="info")
+		save_button.place(relx=0.98, rely=0.85, anchor="ne", width=80, height=30)
+
+	def _save_rules(self, window, rules_textbox, status_label) -> None:
+		'''Keep the rules if they parse, otherwise show what is wrong'''
+		text = rules_textbox.get(1.0, END).strip()
+		try:
+			rules = fuzzrules.FuzzRules(text).rules
+		except ValueError as e:
+			status_label.config(text=str(e))
+			return
+		self.rules_text = text
+		self._show_rule_count(len(rules))
+		window.destroy()
+
+	def _show_rule_count(self, num_rules: int) -> None:
+		'''Show how many rules the next run uses on the rules button'''
+		if num_rules:
+			self.rules_button.config(text=f"Rules ({num_rules})", bootstyle="warning")
+		else:
+			self.rules_button.config(text="Rules", bootstyle="secondary outline")
+
+	def _add_rate_limit_spinbox(self, parent_frame) -> None:
+		'''Add a spinbox for the requests per second shared by all workers, 0 is unlimited'''
+		self.rate_limit_spinbox = tb.Spinbox(parent_frame, from_=0, to=100000, increment=10, bootstyle="secondary")
+		self.rate_limit_spinbox.set(0)
+		self.rate_limit_spinbox.place(relx=0.99, rely=0.0, anchor="ne", width=80, height=30)
+		self.rate_limit_label = tb.Label(parent_frame, text="Max RPS:")
+		self.rate_limit_label.place(in_=self.rate_limit_spinbox, relx=0, rely=0, x=-75, width=70, height=30)
+
+	def _add_adaptive_toggle(self, parent_frame) -> None:
+		'''Add a toggle button to ramp concurrency and rate up until the target throttles'''
+		self.adaptive_toggle_int = IntVar()
+		self.adaptive_toggle = tb.Checkbutton(parent_frame, text="Adaptive", variable=self.adaptive_toggle_int, style="secondary.Roundtoggle.Toolbutton")
+		self.adaptive_toggle.place(in_=self.rate_limit_label, relx=0, rely=0, x=-110, width=100, height=30)
+
+	def _rate_limit(self) -> int:
+		'''Return the requests per second cap, 0 if the spinbox is not a number'''
+		try:
+			return max(0, int(self.rate_limit_spinbox.get()))
+		except ValueError:
+			return 0
+
 	def _add_threads_meter(self, parent_frame) -> None:
 		'''Add a meter for the number of fuzzing threads'''
 		self.thread_meter = tb.Meter(parent_frame, bootstyle="danger", subtext="Threads", metertype="semi", amountused=4, amounttotal=100, metersize=150, interactive=True)
@@ -188,6 +319,51 @@ class FuzzTab(tb.Frame):
 		self.stop_button = tb.Button(parent_frame, text="Stop", command=self._stop_fuzzer, bootstyle="secondary", state="disabled", width=20)
 		self.stop_button.place(in_=self.file_tree, relx=0.5, rely=1.0, x=5, y=10, width=80, height=30, bordermode="outside")
 
+	def _add_resume_button(self, parent_frame) -> None:
+		'''Add a button to resume the last unfinished run'''
+		self.resume_button = tb.Button(parent_frame, text="Resume", command=self._resume_fuzzer, bootstyle="secondary", state="disabled", width=20)
+		self.resume_button.place(in_=self.stop_button, relx=1.0, rely=0, x=10, width=80, height=30, bordermode="outside")
+
+	def _add_engine_toggle(self, parent_frame) -> None:
+		'''Add a toggle button to fuzz with the asyncio engine instead of threads'''
+		self.engine_toggle_int = IntVar()
+		self.engine_toggle = tb.Checkbutton(parent_frame, text="Async Engine", variable=self.engine_toggle_int, command=self._click_engine, style="danger.Roundtoggle.Toolbutton")
+		self.engine_toggle.place(in_=self.file_tree, relx=0, rely=1.0, y=10, width=130, height=30, bordermode="outside")
+
+	def _add_keep_alive_toggle(self, parent_frame) -> None:
+		'''Add a toggle button to reuse connections between requests'''
+		self.keep_alive_toggle_int = IntVar(value=1)
+		self.keep_alive_toggle = tb.Checkbutton(parent_frame, text="Keep-Alive", variable=self.keep_alive_toggle_int, style="danger.Roundtoggle.Toolbutton")
+		self.keep_alive_toggle.place(in_=self.engine_toggle, relx=1.0, rely=0, width=110, height=30)
+
+	def _add_pool_block_toggle(self, parent_frame) -> None:
+		'''Add a toggle button to wait for a pooled connection instead of opening extra ones'''
+		self.pool_block_toggle_int = IntVar()
+		self.pool_block_toggle = tb.Checkbutton(parent_frame, text="Block", variable=self.pool_block_toggle_int, style="danger.Roundtoggle.Toolbutton")
+		self.pool_block_toggle.place(in_=self.file_tree, relx=1.0, rely=1.0, x=-80, y=10, width=80, height=30, bordermode="outside")
+
+	def _add_pool_size_spinbox(self, parent_frame) -> None:
+		'''Add a spinbox for connections pooled per host, 0 uses the thread count'''
+		self.pool_size_label = tb.Label(parent_frame, text="Pool Size:")
+		self.pool_size_label.place(in_=self.pool_block_toggle, relx=0, rely=0, x=-160, width=70, height=30)
+		self.pool_size_spinbox = tb.Spinbox(parent_frame, from_=0, to=5000, increment=1, bootstyle="danger")
+		self.pool_size_spinbox.set(0)
+		self.pool_size_spinbox.place(in_=self.pool_block_toggle, relx=0, rely=0, x=-90, width=80, height=30)
+
+	def _pool_size(self) -> int:
+		'''Return the pool size, 0 if the spinbox is not a number'''
+		try:
+			return max(0, int(self.pool_size_spinbox.get()))
+		except ValueError:
+			return 0
+
+	def _click_engine(self) -> None:
+		'''Switch the threads meter between thread count and in-flight requests'''
+		if self.engine_toggle_int.get() == 1:
+			self.thread_meter.configure(subtext="In Flight", amounttotal=2000, amountused=200)
+		else:
+			self.thread_meter.configure(subtext="Threads", amounttotal=100, amountused=4)
+
 	#####################
 	### RESULTS FRAME ###
 	#####################
@@ -196,6 +372,12 @@ class FuzzTab(tb.Frame):
 		self.results_frame = tb.Frame(self)
 		# Commented out placement since this pane is now shown yet
 		#self.results_frame.place(relx=0.018, rely=0.07, relwidth=0.9635, relheight=0.876)
+		# Add a selector for stored runs
+		self._add_run_selector(self.results_frame)
+		# Add a button to delete the selected run
+		self._add_delete_run_button(self.results_frame)
+		# Add a toggle to show one row per response cluster
+		self._add_cluster_toggle(self.results_frame)
 		# Add a table to the results frame
 		self._add_table(self.results_frame)
 		# Add a request text box
@@ -223,10 +405,31 @@ class FuzzTab(tb.Frame):
 		# Add the response search count label
 		self._add_response_search_count_label(self.results_frame)
 
+	def _add_run_selector(self, parent_frame) -> None:
+		'''Add a menu of the runs stored in the database'''
+		self.run_label = tb.Label(parent_frame, text="Run:")
+		self.run_label.place(relx=0.01, rely=0.001, width=40, height=30)
+		self.mb_runs = tb.Menubutton(parent_frame, text="", bootstyle="secondary")
+		self.mb_runs.place(in_=self.run_label, relx=1.0, rely=0, width=600, height=30)
+		self.run_menu = tb.Menu(self.mb_runs)
+		self.run_int = IntVar()
+		self.mb_runs["menu"] = self.run_menu
+
+	def _add_delete_run_button(self, parent_frame) -> None:
+		'''Add a button to delete the selected run'''
+		self.delete_run_button = tb.Button(parent_frame, text="Delete Run", command=self._delete_run, bootstyle="secondary", width=20)
+		self.delete_run_button.place(in_=self.mb_runs, relx=1.0, rely=0, x=10, width=100, height=30)
+
+	def _add_cluster_toggle(self, parent_frame) -> None:
+		'''Add a toggle button to list response clusters, rarest first'''
+		self.cluster_toggle_int = IntVar()
+		self.cluster_toggle = tb.Checkbutton(parent_frame, text="Rarest Clusters", variable=self.cluster_toggle_int, command=self._click_cluster_view, style="info.Roundtoggle.Toolbutton")
+		self.cluster_toggle.place(in_=self.delete_run_button, relx=1.0, rely=0, x=20, width=150, height=30)
+
 	def _add_table(self, parent_frame) -> None:
 		'''Add a table to the tab'''
 		self.fuzz_table = Tableview(parent_frame, paginated=False, autofit=True, bootstyle="secondary", coldata=self.cols, rowdata=(), searchable=False)
-		self.fuzz_table.place(relx=0.01, rely=0.001, relwidth=0.98, relheight=0.48)
+		self.fuzz_table.place(relx=0.01, rely=0.05, relwidth=0.98, relheight=0.43)
 		self.fuzz_table.view.bind("<Double-1>", self._double_click_row)
 
 	### FUZZ REQUEST ###
@@ -348,12 +551,12 @@ class FuzzTab(tb.Frame):
 			self.request_id = rowid
 			self._clear_fuzzer()
 			self._switch_pane(0)
-			self.notebook.cursor.execute('''SELECT request_method, request_url, request_headers, request_body FROM transactions WHERE id = ?;''',(rowid,))
+			self.notebook.cursor.execute('''SELECT t.request_method, t.request_url, t.request_headers, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.request_body_hash WHERE t.id = ?;''',(rowid,))
 			row = self.notebook.cursor.fetchone()
 			if row:
 				self.selected_request_id = rowid
 				method, url, headers, body = row
-				raw_request = self.cb.rebuild_request(method, url, headers, body)
+				raw_request = self.cb.rebuild_request(method, url, headers, self.bs.decode(body))
 				self.request_textbox.__dict__["children"]["!text"].insert(END, raw_request)
 
 	def _clear_payload_positions(self) -> None:
@@ -377,15 +580,38 @@ class FuzzTab(tb.Frame):
 
 	def _start_fuzzer_thread(self) -> None:
 		'''Start fuzzer'''
-		if self.sp.selections:
-			t = threading.Thread(target=self._start_fuzzer, args=())
-			t.daemon = True
-			t.start()
-
-	def _start_fuzzer(self) -> None:
-		'''Start the fuzzer'''
+		if self.sp.selections and not self.fzr.is_running:
+			template_info = self.sp.prepare_template(self.request_textbox)
+			if template_info:
+				self._start_fuzzer(template_info, source_id=max(0, self.selected_request_id))
+
+	def _resume_fuzzer(self) -> None:
+		'''Resume the selected run with the current engine settings'''
+		if self.notebook.cursor and not self.fzr.is_running and self.selected_run:
+			state = self.fzr.load_state(self.notebook.cursor, self.selected_run)
+			if state:
+				self.enc_str.set(state["encoder"])
+				self.mb_encoders.config(text=state["encoder"])
+				self.mode_str.set(state["mode"])
+				self.mb_modes.config(text=state["mode"])
+				self.rules_text = state["rules"]
+				self._show_rule_count(len(fuzzrules.FuzzRules(self.rules_text).rules))
+				self._start_fuzzer((state["template"], state["file_paths"], state["originals"]), resume_run=self.selected_run, source_id=state["source_id"])
+
+	def _update_resume_button(self) -> None:
+		'''Enable the resume button if the selected run is unfinished'''
+		if self.notebook.cursor and not self.fzr.is_running and self.selected_run and self.fzr.load_state(self.notebook.cursor, self.selected_run):
+			self.resume_button.config(bootstyle="warning", state="normal")
+		else:
+			self.resume_button.config(bootstyle="secondary", state="disabled")
+
+	def _start_fuzzer(self, template_info: tuple, resume_run: int=0, source_id: int=0) -> None:
+		'''Start the fuzzer in a thread, the Tk thread only polls it for results'''
 		self.progress_bar["value"] = 0
-		self.fuzz_table.delete_rows()
+		if resume_run:
+			self._select_run(resume_run)
+		else:
+			self.fuzz_table.delete_rows()
 		self.fuzz_req_textbox.__dict__["children"]["!text"].configure(state="normal")
 		self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="normal")
 		self.fuzz_req_textbox.delete(1.0, END)
@@ -393,75 +619,254 @@ class FuzzTab(tb.Frame):
 		self.fuzz_req_textbox.__dict__["children"]["!text"].configure(state="disabled")
 		self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="disabled")
 		self.fuzz_button.config(bootstyle="secondary", state="disabled")
+		self.resume_button.config(bootstyle="secondary", state="disabled")
 		self.clear_button.config(state="disabled")
 		self.select_button.config(state="disabled")
 		self.stop_button.config(bootstyle="danger", state="normal")
-		self.update()
+		self.engine_toggle.config(state="disabled")
+		self.mb_modes.config(state="disabled")
+		self.rules_button.config(state="disabled")
+		self.adaptive_toggle.config(state="disabled")
+		self.delete_run_button.config(state="disabled")
+		self.connection_stats_label.config(text="")
 		self._switch_pane(1)
 		encoder = self.enc_str.get()
 		thread_count = int(self.thread_meter.amountusedvar.get())
+		engine = self.fzr.engines[self.engine_toggle_int.get()]
 		delay_time = int(self.delay_meter.amountusedvar.get())
 		timeout_length = int(self.timeout_meter.amountusedvar.get())
-		template_info = self.sp.prepare_template(self.request_textbox)
-		if template_info:
-			template, ordered_file_paths = template_info
-			self.fzr.fuzz(template, ordered_file_paths, encoder, timeout_length, thread_count, delay_time, self.notebook.conn, self.notebook.cursor, self.progress_bar, self.fuzz_table)
+		template, ordered_file_paths, originals = template_info
+		mode = self.mode_str.get()
+		# Drop rows a stopped run left behind
+		while not self.fzr.ui_queue.empty():
+			self.fzr.ui_queue.get_nowait()
+		self.fuzz_counts = {"rows": 0, "errors": 0, "reflected": 0, "start": time.time(), "refreshed": 0.0, "clustered": 0.0}
+		self.fuzz_counts_label.config(text="")
+		# Marks the run as started before the poll loop first checks it
+		self.fzr.is_running = True
+		# Until the fuzzer creates a new run the poll loop has no clusters to show
+		self.fzr.run_id = resume_run
+		self.fuzz_thread = threading.Thread(target=self.fzr.fuzz, args=(template, ordered_file_paths, encoder, timeout_length, thread_count, delay_time, self.notebook.conn, self.notebook.cursor, engine, self._pool_size(), self.pool_block_toggle_int.get() == 1, self.keep_alive_toggle_int.get() == 1, self._rate_limit(), self.adaptive_toggle_int.get() == 1, resume_run, mode, originals, source_id, self.rules_text))
+		self.fuzz_thread.daemon = True
+		self.fuzz_thread.start()
+		self.after(self.frame_ms, self._poll_fuzzer)
+
+	def _poll_fuzzer(self) -> None:
+		'''Add queued result rows to the table on the Tk thread until the run finishes'''
+		finished = not self.fuzz_thread.is_alive()
+		added = 0
+		# Cap the rows added per frame so a fast run cannot starve the event loop
+		while added < self.max_rows_per_frame:
+			try:
+				rows = self.fzr.ui_queue.get_nowait()
+			except queue.Empty:
+				break
+			for row in rows:
+				if not self.cluster_toggle_int.get():
+					self.fuzz_table.view.insert("", "end", values=row)
+				if row[7]:
+					self.fuzz_counts["errors"] += 1
+				if row[5] == "Y":
+					self.fuzz_counts["reflected"] += 1
+			self.fuzz_counts["rows"] += len(rows)
+			added += len(rows)
+		now = time.time()
+		if now - self.fuzz_counts["refreshed"] >= self.refresh_interval:
+			self.fuzz_counts["refreshed"] = now
+			self._update_fuzz_counts(now)
+		if self.cluster_toggle_int.get() and now - self.fuzz_counts["clustered"] >= self.cluster_refresh_interval:
+			self.fuzz_counts["clustered"] = now
+			self._show_clusters(self.fzr.run_id)
+		if finished and self.fzr.ui_queue.empty():
+			self._finish_fuzzer()
+		else:
+			self.after(self.frame_ms, self._poll_fuzzer)
+
+	def _update_fuzz_counts(self, now: float) -> None:
+		'''Update the progress bar and run counters'''
+		rows = self.fuzz_counts["rows"]
+		# Counts results a resumed run recorded before it was stopped
+		done = max(rows, self.fzr.payload_idx)
+		# Pruned requests will never be sent but still move the run along
+		status = (done + self.fzr.rules.num_pruned) / max(1, self.fzr.num_of_payloads)
+		if status < 1.0:
+			self.progress_bar["value"] = status
+		rate = round(rows / max(0.001, now - self.fuzz_counts["start"]))
+		text = f"Sent: {done}/{self.fzr.num_of_payloads}  Rate: {rate}/s  Errors: {self.fuzz_counts['errors']}  Reflected: {self.fuzz_counts['reflected']}"
+		if self.fzr.rules.num_pruned:
+			text += f"  Pruned: {self.fzr.rules.num_pruned}"
+		if self.fzr.rules.pause_remaining():
+			text += f"  Paused: {round(self.fzr.rules.pause_remaining())}s"
+		state = self.fzr.rate_state()
+		if state:
+			text += f"  Limit: {state['limit']}  Cap: {state['rate'] or 'none'}"
+		self.fuzz_counts_label.config(text=text)
+
+	def _finish_fuzzer(self) -> None:
+		'''Reload the results and reset the controls once the fuzzer thread has finished'''
+		self._update_fuzz_counts(time.time())
+		self._show_connection_stats()
+		if self.fzr.error:
+			self.fuzz_counts_label.config(text=self.fzr.error)
+		if self.fzr.run_id:
+			self.selected_run = self.fzr.run_id
 		self._load_table()
-		self.progress_bar.config(bootstyle="success")
 		self.progress_bar["value"] = 0
 		self.stop_button.config(bootstyle="secondary", state="disabled")
 		self.clear_button.config(state="normal")
 		self.select_button.config(state="normal")
+		self.engine_toggle.config(state="normal")
+		self.mb_modes.config(state="normal")
+		self.rules_button.config(state="normal")
+		self.adaptive_toggle.config(state="normal")
+		self.delete_run_button.config(state="normal")
 		self.fuzz_button.config(bootstyle="danger", state="normal")
 
+	def _show_connection_stats(self) -> None:
+		'''Show how many handshakes the last run cost'''
+		stats = self.fzr.connection_stats()
+		self.connection_stats_label.config(text=f"Connections: {stats['connections']} opened for {stats['requests']} requests ({stats['reuse_rate']}% reused)")
+
 	def _stop_fuzzer(self) -> None:
-		'''Stop the fuzzer'''
+		'''Stop the fuzzer, the poll loop resets the controls once it has wound down'''
 		self.stop_button.config(bootstyle="secondary", state="disabled")
-		self.update()
 		self.fzr.kill_fuzzer(self.notebook.conn)
-		self.clear_button.config(state="normal")
-		self.select_button.config(state="normal")
-		self.fuzz_button.config(bootstyle="danger", state="normal")
-		self.fuzz_table.load_table_data()
+
+	def _run_text(self, run: tuple) -> str:
+		'''Return the menu label of a run'''
+		run_id, started, template, total, completed, finished = run
+		request_line = template.split("\n", 1)[0][:80]
+		text = f"#{run_id}  {started}  {request_line}  ({completed}/{total})"
+		if not finished:
+			text += "  unfinished"
+		return text
+
+	def _load_runs(self) -> None:
+		'''Fill the run menu, keeping the selected run or falling back to the newest'''
+		self.run_menu.delete(0, "end")
+		runs = self.fzr.list_runs(self.notebook.cursor)
+		ids = [run[0] for run in runs]
+		if self.selected_run not in ids:
+			self.selected_run = ids[0] if ids else 0
+		self.run_int.set(self.selected_run)
+		self.mb_runs.config(text="")
+		for run in runs:
+			text = self._run_text(run)
+			self.run_menu.add_radiobutton(label=text, variable=self.run_int, value=run[0], command=self._click_run)
+			if run[0] == self.selected_run:
+				self.mb_runs.config(text=text)
+
+	def _select_run(self, run_id: int) -> None:
+		'''Show the results of a run'''
+		self.selected_run = run_id
+		self._load_table()
+
+	def _click_run(self) -> None:
+		'''Click a run option on the menu'''
+		if not self.fzr.is_running:
+			self._select_run(self.run_int.get())
+		else:
+			self.run_int.set(self.selected_run)
+
+	def _delete_run(self) -> None:
+		'''Delete the selected run and its results'''
+		if self.notebook.cursor and self.selected_run and not self.fzr.is_running:
+			self.fzr.delete_run(self.notebook.conn, self.selected_run)
+			self.selected_run = 0
+			self._load_table()
+
+	def _click_cluster_view(self) -> None:
+		'''Switch the table between every result and one row per cluster'''
+		if not self.fzr.is_running:
+			self._load_table()
+		elif self.cluster_toggle_int.get():
+			self._show_clusters(self.fzr.run_id)
+		else:
+			# Results of the run so far are reloaded once it finishes
+			self.fuzz_table.delete_rows()
+
+	def _show_clusters(self, run_id: int) -> None:
+		'''Fill the table with the first response of each cluster of a run, rarest first'''
+		self.fuzz_table.delete_rows()
+		for row in self.fzr.rc.ranked(self.notebook.cursor, run_id, self.max_cluster_rows):
+			self.fuzz_table.view.insert("", "end", values=row)
 
 	def _load_table(self) -> None:
-		'''Load table rows from the database'''
+		'''Load table rows of the selected run from the database'''
 		self.fuzz_table.delete_rows()
-		self.notebook.cursor.execute('''SELECT id, status_code, rtt, content_length, payloads, reflected, timeout, errors, timestamp FROM fuzz;''')
+		self._load_runs()
+		if self.cluster_toggle_int.get():
+			self._show_clusters(self.selected_run)
+			self._update_resume_button()
+			return
+		self.notebook.cursor.execute('''SELECT id, status_code, rtt, content_length, payloads, reflected, timeout, errors, timestamp, reflection, cluster_id FROM fuzz WHERE run_id = ?;''', (self.selected_run,))
 		rows = self.notebook.cursor.fetchall()
 		if rows:
 			self.fuzz_table.build_table_data(coldata=self.cols, rowdata=rows)
+		self._update_resume_button()
 
 	def _double_click_row(self, event) -> None:
 		'''Click a row'''
+		# Read the values from the view so rows added during a run can be opened too
 		try:
 			iid = self.fuzz_table.view.focus()
-			row = self.fuzz_table.get_row(iid=iid)
+			values = self.fuzz_table.view.item(iid, "values")
 		except:
-			row = None
-		if row:
-			if row.values:
-				request_id = row.values[0]
-				if request_id != self.last_clicked:
-					self.last_clicked = request_id
-					self.notebook.cursor.execute('''SELECT raw_request, raw_response FROM fuzz WHERE id = ?;''',(request_id,))
-					fuzz_request_info = self.notebook.cursor.fetchone()
-					if fuzz_request_info:
-						raw_request, raw_response = fuzz_request_info
-						# Set the text in each pane.
-						### ENABLE DISABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
-						self.fuzz_req_textbox.__dict__["children"]["!text"].configure(state="normal")
-						self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="normal")
-						self.fuzz_req_textbox.delete(1.0, END)
-						self.fuzz_res_textbox.delete(1.0, END)
-						self.fuzz_req_textbox.insert(END, raw_request)
-						self.fuzz_res_textbox.insert(END, raw_response)
-						### DISABLE ENABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
-						self.fuzz_req_textbox.__dict__["children"]["!text"].configure(state="disabled")
-						self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="disabled")
-						# Perform searches
-						self._search_request(True)
-						self._search_response(True)
+			values = ()
+		if values:
+			request_id = int(values[0])
+			if request_id != self.last_clicked:
+				self._show_result(request_id)
+
+	def _show_result(self, fuzz_id: int) -> None:
+		'''Show the raw request and response of a fuzz result'''
+		# Set here so results opened from other tabs get their beautified response too
+		self.last_clicked = fuzz_id
+		self.notebook.cursor.execute('''SELECT raw_request, raw_response FROM fuzz WHERE id = ?;''',(fuzz_id,))
+		fuzz_request_info = self.notebook.cursor.fetchone()
+		if fuzz_request_info:
+			raw_request, raw_response = [self.bs.decode(i) for i in fuzz_request_info]
+			# Responses are stored as received
+			if len(raw_response) > self.inline_beautify_size:
+				t = threading.Thread(target=self._beautify_response, args=(fuzz_id, raw_response))
+				t.daemon = True
+				t.start()
+				self.after(self.frame_ms, self._poll_beautified)
+			else:
+				raw_response = self.cb.beautify_raw_response(raw_response)
+			# Set the text in each pane.
+			### ENABLE DISABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
+			self.fuzz_req_textbox.__dict__["children"]["!text"].configure(state="normal")
+			self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="normal")
+			self.fuzz_req_textbox.delete(1.0, END)
+			self.fuzz_res_textbox.delete(1.0, END)
+			self.fuzz_req_textbox.insert(END, raw_request)
+			self.fuzz_res_textbox.insert(END, raw_response)
+			### DISABLE ENABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
+			self.fuzz_req_textbox.__dict__["children"]["!text"].configure(state="disabled")
+			self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="disabled")
+			# Perform searches
+			self._search_request(True)
+			self._search_response(True)
+
+	def _beautify_response(self, fuzz_id: int, raw_response: str) -> None:
+		'''Beautify a large response off the Tk thread'''
+		self.beautified_queue.put((fuzz_id, self.cb.beautify_raw_response(raw_response)))
+
+	def _poll_beautified(self) -> None:
+		'''Replace the shown response with its beautified text once it is ready'''
+		try:
+			fuzz_id, raw_response = self.beautified_queue.get_nowait()
+		except queue.Empty:
+			self.after(self.frame_ms, self._poll_beautified)
+			return
+		# Another row may have been opened in the meantime
+		if fuzz_id == self.last_clicked:
+			self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="normal")
+			self.fuzz_res_textbox.delete(1.0, END)
+			self.fuzz_res_textbox.insert(END, raw_response)
+			self.fuzz_res_textbox.__dict__["children"]["!text"].configure(state="disabled")
+			self._search_response(True)
 
 	def _search_request(self, new_click_target: bool=False):
 		'''Search the request'''
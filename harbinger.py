@@ -1,9 +1,13 @@
 #! /usr/bin/env python3
 
+import multiprocessing
 import app
 
 ############
 ### MAIN ###
 ############
-gui = app.App()
-gui.run()
+if __name__ == "__main__":
+	# Required for the HAR import process pool in frozen executables
+	multiprocessing.freeze_support()
+	gui = app.App()
+	gui.run()
@@ -3,15 +3,33 @@
 import re
 import os
 import json
+import time
+import queue
 import sqlite3
+import multiprocessing
 from urllib.parse import urlparse
 import xml.etree.ElementTree as ET
+import bodystore
+import dbschema
+import searchindex
 
 class Harparse:
 
-	def __init__(self) -> None:
+	def __init__(self, chunk_size: int=1000) -> None:
 		'''Initialize HAR parser'''
-		pass
+		self.chunk_size = chunk_size
+		self.bs = bodystore.BodyStore()
+		self.schema = dbschema.DBSchema()
+		self.si = searchindex.SearchIndex()
+		self.search_enabled = False
+		# Seconds the writer waits for rows before checking on the workers
+		self.poll_interval = 1.0
+		# PRAGMAs applied for the duration of an import, then restored
+		self.import_pragmas = {
+			"journal_mode": "MEMORY",
+			"synchronous": "OFF",
+			"cache_size": -65536
+		}
 
 	def _load_har(self, fpath: str) -> dict:
 		'''Return a loaded HAR file'''
@@ -27,40 +45,27 @@ class Harparse:
 		'''Create the database'''
 		conn = sqlite3.connect(dbpath)
 		cursor = conn.cursor()
-		cursor.execute('''CREATE TABLE transactions (
-			id INTEGER PRIMARY KEY AUTOINCREMENT,
-			timestamp TEXT,
-			ip_address TEXT,
-			port TEXT,
-			request_method TEXT,
-			request_url TEXT,
-			request_params TEXT,
-			request_headers TEXT,
-			request_has_input TEXT,
-			request_body TEXT,
-			request_body_type TEXT,
-			request_file_extension TEXT,
-			response_status_code TEXT,
-			response_status_message TEXT,
-			response_headers TEXT,
-			response_body TEXT
-		);''')
-		cursor.execute('''CREATE TABLE fuzz (
-			id INTEGER PRIMARY KEY AUTOINCREMENT,
-			status_code TEXT,
-			rtt TEXT,
-			content_length TEXT,
-			payloads TEXT,
-			reflected TEXT,
-			timeout TEXT,
-			errors TEXT,
-			timestamp TEXT,
-			raw_request TEXT,
-			raw_response TEXT
-		);''')
+		self.schema.upgrade(conn)
+		self.bs.save_settings(cursor)
 		conn.commit()
 		conn.close()
 
+	def _migrate_db(self, dbpath: str) -> None:
+		'''Upgrade a database created by an older version'''
+		conn = sqlite3.connect(dbpath)
+		self.schema.upgrade(conn)
+		conn.close()
+
+	def _prepare_db(self, dbpath: str) -> None:
+		'''Create or upgrade the database and adopt its body storage mode'''
+		if not os.path.isfile(dbpath):
+			self._create_db(dbpath)
+		else:
+			self._migrate_db(dbpath)
+		conn = sqlite3.connect(dbpath)
+		self.bs.load_settings(conn.cursor())
+		conn.close()
+
 	def _has_inputs(self, request: dict) -> int:
 		'''Return 1 if the request has a query string or post data'''
 		if "queryString" in request:
@@ -138,108 +143,373 @@ class Harparse:
 		else:
 			return ""
 
-	def parse(self, harfile: str, dbpath: str) -> None:
-		'''Parse HAR file and insert entries into database'''
-		if not os.path.isfile(dbpath):
-			self._create_db(dbpath)
-		har = self._load_har(harfile)
-		conn = sqlite3.connect(dbpath)
+	def _iter_entries(self, fpath: str):
+		'''Yield HAR entries one at a time without loading the whole file'''
+		if os.path.isfile(fpath):
+			yield from HarStream(fpath).entries()
+
+	def _parse_entry(self, entry: dict) -> tuple:
+		'''Return a transactions row and its (hash, content) bodies from a single HAR entry'''
+		# Pull out basic metadata for the transaction
+		timestamp = entry["startedDateTime"]
+		ip_address = ""
+		if "serverIPAddress" in entry:
+			ip_address = entry["serverIPAddress"]
+		port = ""
+		if "connection" in entry:
+			port = entry["connection"]
+		# Pull out request info
+		if "request" in entry:
+			request_method = entry["request"]["method"]
+			request_url = entry["request"]["url"]
+			request_headers = json.dumps(entry["request"]["headers"])
+			content_type = self.get_content_type(entry["request"]["headers"])
+			if self._has_inputs(entry["request"]):
+				request_has_input = "Y"
+			else:
+				request_has_input = "N"
+			request_body = ""
+			if "postData" in entry["request"]:
+				if "encoding" in entry["request"]["postData"]: # binary data (images, etc)
+					request_body = "<BINARY_DATA>" + entry["request"]["postData"]["text"] + "</BINARY_DATA>"
+				else:
+					request_body = entry["request"]["postData"]["text"]
+			request_body_type = ""
+			if request_body:
+				request_body_type = self.evaluate_mimetype(request_body, content_type)
+			request_file_extension = self._file_ext(request_url)
+			request_params = self._get_input_params(request_method, request_body_type, entry["request"])
+		else:
+			request_method = ""
+			request_url = ""
+			request_headers = ""
+			request_has_input = ""
+			request_body = ""
+			request_body_type = ""
+			request_file_extension = ""
+			request_params = ""
+		# Pull out response info
+		if "response" in entry:
+			response_status_code = str(entry["response"]["status"])
+			response_status_message = entry["response"]["statusText"]
+			response_headers = json.dumps(entry["response"]["headers"])
+			if "text" in entry["response"]["content"]:
+				if "encoding" in entry["response"]["content"]:
+					response_body = "<BINARY_DATA>" + entry["response"]["content"]["text"] + "</BINARY_DATA>"
+				else:
+					response_body = entry["response"]["content"]["text"]
+			elif "comment" in entry["response"]["content"]:
+				response_body = "//" + entry["response"]["content"]["comment"]
+			else:
+				response_body = "//NO RESPONSE OR COMMENT CAPTURED IN HAR FILE"
+		else:
+			response_status_code = ""
+			response_status_message = ""
+			response_headers = ""
+			response_body = ""
+		request_body_hash, request_content = self.bs.prepare(request_body)
+		response_body_hash, response_content = self.bs.prepare(response_body)
+		bodies = [(request_body_hash, request_content), (response_body_hash, response_content)]
+		row = (
+			timestamp,
+			ip_address,
+			port,
+			request_method,
+			request_url,
+			request_params,
+			request_headers,
+			request_has_input,
+			request_body_hash,
+			request_body_type,
+			request_file_extension,
+			response_status_code,
+			response_status_message,
+			response_headers,
+			response_body_hash
+		)
+		return (row, bodies)
+
+	def _set_import_pragmas(self, cursor: sqlite3.Cursor) -> dict:
+		'''Apply the import PRAGMAs and return the values they replaced'''
+		previous = {}
+		for name, value in self.import_pragmas.items():
+			previous[name] = cursor.execute(f"PRAGMA {name};").fetchone()[0]
+			cursor.execute(f"PRAGMA {name} = {value};")
+		return previous
+
+	def _restore_pragmas(self, cursor: sqlite3.Cursor, previous: dict) -> None:
+		'''Put back the PRAGMA values that were in place before the import'''
+		for name, value in previous.items():
+			cursor.execute(f"PRAGMA {name} = {value};")
+
+	def _insert_rows(self, cursor: sqlite3.Cursor, entries: list) -> None:
+		'''Insert a chunk of parsed entries, storing each distinct body once'''
+		if self.search_enabled:
+			last_id = self.si.last_rowid(cursor, "transactions")
+			last_body = self.si.last_rowid(cursor, "bodies")
+		self.bs.store_many(cursor, [body for row, bodies in entries for body in bodies])
+		cursor.executemany('''INSERT INTO transactions (
+			timestamp,
+			ip_address,
+			port,
+			request_method,
+			request_url,
+			request_params,
+			request_headers,
+			request_has_input,
+			request_body_hash,
+			request_body_type,
+			request_file_extension,
+			response_status_code,
+			response_status_message,
+			response_headers,
+			response_body_hash
+		) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);''', [row for row, bodies in entries])
+		# Keep the full-text index current, only new bodies are indexed
+		if self.search_enabled:
+			self.si.index_bodies(cursor, last_body)
+			self.si.index_transactions(cursor, last_id)
+
+	def _import_stats(self, rows: int, seconds: float) -> dict:
+		'''Return the result of an import with its ingest throughput'''
+		rows_per_sec = rows
+		if seconds > 0:
+			rows_per_sec = rows / seconds
+		return {"rows": rows, "seconds": round(seconds, 3), "rows_per_sec": round(rows_per_sec, 1)}
+
+	def parse(self, harfile: str, dbpath: str, stream: bool=True) -> dict:
+		'''Parse HAR file and bulk insert entries into database, return import stats'''
+		t1 = time.time()
+		self._prepare_db(dbpath)
+		if stream:
+			# Walk log.entries incrementally so memory is bounded by the largest entry
+			entries = self._iter_entries(harfile)
+		else:
+			har = self._load_har(harfile)
+			entries = har.get("log", {}).get("entries", [])
+		# Transactions are managed explicitly so the whole import is one write
+		conn = sqlite3.connect(dbpath, isolation_level=None)
 		cursor = conn.cursor()
-		if "log" in har:
-			log = har["log"]
-			if "entries" in log:
-				for entry in log["entries"]:
-					# Pull out basic metadata for the transaction
-					timestamp = entry["startedDateTime"]
-					ip_address = ""
-					if "serverIPAddress" in entry:
-						ip_address = entry["serverIPAddress"]
-					port = ""
-					if "connection" in entry:
-						port = entry["connection"]
-					# Pull out request info
-					if "request" in entry:
-						request_method = entry["request"]["method"]
-						request_url = entry["request"]["url"]
-						request_headers = json.dumps(entry["request"]["headers"])
-						content_type = self.get_content_type(json.loads(request_headers))
-						if self._has_inputs(entry["request"]):
-							request_has_input = "Y"
-						else:
-							request_has_input = "N"
-						request_body = ""
-						if "postData" in entry["request"]:
-							if "encoding" in entry["request"]["postData"]: # binary data (images, etc)
-								request_body = "<BINARY_DATA>" + entry["request"]["postData"]["text"] + "</BINARY_DATA>"
-							else:
-								request_body = entry["request"]["postData"]["text"]
-						request_body_type = ""
-						if request_body:
-							request_body_type = self.evaluate_mimetype(request_body, content_type)
-						request_file_extension = self._file_ext(request_url)
-						request_params = self._get_input_params(request_method, request_body_type, entry["request"])
-					else:
-						request_method = ""
-						request_url = ""
-						request_headers = ""
-						request_has_input = ""
-						request_body = ""
-						request_body_type = ""
-						request_file_extension = ""
-						request_params = ""
-					# Pull out response info
-					if "response" in entry:
-						response_status_code = str(entry["response"]["status"])
-						response_status_message = entry["response"]["statusText"]
-						response_headers = json.dumps(entry["response"]["headers"])
-						if "text" in entry["response"]["content"]:
-							if "encoding" in entry["response"]["content"]:
-								response_body = "<BINARY_DATA>" + entry["response"]["content"]["text"] + "</BINARY_DATA>"
-							else:
-								response_body = entry["response"]["content"]["text"]
-						elif "comment" in entry["response"]["content"]:
-							response_body = "//" + entry["response"]["content"]["comment"]
+		previous = self._set_import_pragmas(cursor)
+		self.search_enabled = self.si.available(cursor)
+		rows_added = 0
+		try:
+			cursor.execute("BEGIN;")
+			chunk = []
+			for entry in entries:
+				chunk.append(self._parse_entry(entry))
+				if len(chunk) >= self.chunk_size:
+					self._insert_rows(cursor, chunk)
+					rows_added += len(chunk)
+					chunk = []
+			if chunk:
+				self._insert_rows(cursor, chunk)
+				rows_added += len(chunk)
+			cursor.execute("COMMIT;")
+		finally:
+			if conn.in_transaction:
+				conn.rollback()
+			self._restore_pragmas(cursor, previous)
+			conn.close()
+		return self._import_stats(rows_added, time.time() - t1)
+
+	def _parse_file_to_queue(self, harfile: str, results, workers) -> None:
+		'''Worker process: stream a HAR file and queue its rows in chunks'''
+		# Lets the writer notice a worker that dies before finishing the file
+		workers[harfile] = os.getpid()
+		error = ""
+		try:
+			chunk = []
+			for entry in self._iter_entries(harfile):
+				chunk.append(self._parse_entry(entry))
+				if len(chunk) >= self.chunk_size:
+					results.put((harfile, chunk, error))
+					chunk = []
+			if chunk:
+				results.put((harfile, chunk, error))
+		except Exception as e:
+			error = str(e)
+		# A None chunk tells the writer this file is finished
+		results.put((harfile, None, error))
+
+	def _failed_files(self, files: dict, tasks: dict, workers) -> list:
+		'''Return (HAR file, error) of unfinished files whose task failed or whose worker process is gone'''
+		alive = set(process.pid for process in multiprocessing.active_children())
+		failed = []
+		for harfile, task in tasks.items():
+			if files[harfile]["done"]:
+				continue
+			if task.ready() and not task.successful():
+				try:
+					task.get()
+				except Exception as e:
+					failed.append((harfile, str(e) or type(e).__name__))
+			elif not task.ready() and harfile in workers and workers[harfile] not in alive:
+				failed.append((harfile, "Worker process exited before finishing the file"))
+		return failed
+
+	def parse_many(self, harfiles: list, dbpath: str, progress=None, processes: int=0) -> dict:
+		'''Parse HAR files in a process pool and write them through one connection, return import stats'''
+		t1 = time.time()
+		harfiles = list(dict.fromkeys(harfiles))
+		self._prepare_db(dbpath)
+		if not processes:
+			processes = os.cpu_count() or 1
+		processes = max(1, min(processes, len(harfiles)))
+		files = {}
+		for harfile in harfiles:
+			files[harfile] = {"rows": 0, "done": False, "error": ""}
+		conn = sqlite3.connect(dbpath, isolation_level=None)
+		cursor = conn.cursor()
+		previous = self._set_import_pragmas(cursor)
+		self.search_enabled = self.si.available(cursor)
+		rows_added = 0
+		try:
+			cursor.execute("BEGIN;")
+			with multiprocessing.Manager() as manager:
+				# Bounded so fast parsers cannot outrun the single writer
+				results = manager.Queue(maxsize=processes * 4)
+				workers = manager.dict()
+				with multiprocessing.Pool(processes) as pool:
+					tasks = {}
+					for harfile in harfiles:
+						tasks[harfile] = pool.apply_async(self._parse_file_to_queue, (harfile, results, workers))
+					remaining = len(harfiles)
+					while remaining:
+						try:
+							harfile, rows, error = results.get(timeout=self.poll_interval)
+						except queue.Empty:
+							# A killed worker never queues its end of file and its task never completes
+							for harfile, error in self._failed_files(files, tasks, workers):
+								remaining -= 1
+								files[harfile]["done"] = True
+								files[harfile]["error"] = error
+								if progress:
+									progress(harfile, files[harfile]["rows"], True, error)
+							continue
+						if rows is None:
+							if files[harfile]["done"]:
+								continue
+							remaining -= 1
+							files[harfile]["done"] = True
+							files[harfile]["error"] = error
 						else:
-							response_body = "//NO RESPONSE OR COMMENT CAPTURED IN HAR FILE"
-					else:
-						response_status_code = ""
-						response_status_message = ""
-						response_headers = ""
-						response_body = ""
-					# Insert records into database
-					cursor.execute('''INSERT INTO transactions (
-						timestamp,
-						ip_address,
-						port,
-						request_method,
-						request_url,
-						request_params,
-						request_headers,
-						request_has_input,
-						request_body,
-						request_body_type,
-						request_file_extension,
-						response_status_code,
-						response_status_message,
-						response_headers,
-						response_body
-					) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?);''', (
-						timestamp,
-						ip_address,
-						port,
-						request_method,
-						request_url,
-						request_params,
-						request_headers,
-						request_has_input,
-						request_body,
-						request_body_type,
-						request_file_extension,
-						response_status_code,
-						response_status_message,
-						response_headers,
-						response_body)
-					)
-		conn.commit()
-		conn.close()
+							self._insert_rows(cursor, rows)
+							rows_added += len(rows)
+							files[harfile]["rows"] += len(rows)
+						if progress:
+							progress(harfile, files[harfile]["rows"], files[harfile]["done"], files[harfile]["error"])
+			cursor.execute("COMMIT;")
+		finally:
+			if conn.in_transaction:
+				conn.rollback()
+			self._restore_pragmas(cursor, previous)
+			conn.close()
+		stats = self._import_stats(rows_added, time.time() - t1)
+		stats["files"] = files
+		return stats
+
+class HarStream:
 
+	def __init__(self, fpath: str, chunk_size: int=1048576) -> None:
+		'''Initialize an incremental reader for the entries of a HAR file'''
+		self.fpath = fpath
+		self.chunk_size = chunk_size
+		self.decoder = json.JSONDecoder()
+		self.whitespace = re.compile(r"[ \t\r\n]*")
+		self.f = None
+		self.buf = ""
+		self.pos = 0
+		self.eof = False
+
+	def _fill(self, size: int) -> bool:
+		'''Drop consumed text and read more of the file, return False at end of file'''
+		if self.eof:
+			return False
+		data = self.f.read(size)
+		if not data:
+			self.eof = True
+			return False
+		self.buf = self.buf[self.pos:] + data
+		self.pos = 0
+		return True
+
+	def _peek(self) -> str:
+		'''Return the next non-whitespace character without consuming it'''
+		while 1:
+			self.pos = self.whitespace.match(self.buf, self.pos).end()
+			if self.pos < len(self.buf):
+				return self.buf[self.pos]
+			if not self._fill(self.chunk_size):
+				return ""
+
+	def _expect(self, char: str) -> None:
+		'''Consume a structural character or fail on malformed input'''
+		found = self._peek()
+		if found != char:
+			raise ValueError(f"Malformed HAR file: expected '{char}' but found '{found}' in {self.fpath}")
+		self.pos += 1
+
+	def _value(self):
+		'''Decode and consume the next complete JSON value'''
+		self._peek()
+		size = self.chunk_size
+		while 1:
+			try:
+				value, end = self.decoder.raw_decode(self.buf, self.pos)
+				# A value ending exactly at the buffer edge may be a truncated number
+				if end < len(self.buf) or self.eof:
+					self.pos = end
+					return value
+			except json.JSONDecodeError:
+				if self.eof:
+					raise
+			# Grow reads geometrically so a huge entry is not re-decoded once per chunk
+			self._fill(size)
+			size *= 2
+
+	def _object_keys(self):
+		'''Yield each key of the next object, the caller must consume its value'''
+		self._expect("{")
+		if self._peek() == "}":
+			self.pos += 1
+			return
+		while 1:
+			key = self._value()
+			self._expect(":")
+			yield key
+			if self._peek() == ",":
+				self.pos += 1
+			else:
+				self._expect("}")
+				return
+
+	def _array_values(self):
+		'''Yield each value of the next array'''
+		self._expect("[")
+		if self._peek() == "]":
+			self.pos += 1
+			return
+		while 1:
+			yield self._value()
+			if self._peek() == ",":
+				self.pos += 1
+			else:
+				self._expect("]")
+				return
+
+	def entries(self):
+		'''Yield each object in log.entries, skipping everything else'''
+		with open(self.fpath, encoding="utf-8-sig") as self.f:
+			self.buf = ""
+			self.pos = 0
+			self.eof = False
+			for key in self._object_keys():
+				if key == "log":
+					for log_key in self._object_keys():
+						if log_key == "entries":
+							yield from self._array_values()
+						else:
+							self._value()
+				else:
+					self._value()
@@ -4,8 +4,8 @@ import re
 from tkinter import *
 import ttkbootstrap as tb
 from ttkbootstrap.scrolled import ScrolledText
-from ttkbootstrap.tableview import Tableview
 import contextmenu
+import bodystore
 import contentbeautifier
 import scrolledtextsearch
 
@@ -20,15 +20,27 @@ class HistoryTab(tb.Frame):
 		super().__init__(self.notebook)
 		self.notebook.add(self, text="History") # Add itself to the notebook
 		self.cb = contentbeautifier.ContentBeautifier()
+		self.bs = bodystore.BodyStore()
 		self.sts = scrolledtextsearch.ScrolledTextSearch("#35B279")
 		self.cm = contextmenu.ContextMenu()
 		self.last_clicked = -1
+		self.page_size = 500
+		self.sort_column = "id"
+		self.sort_desc = False
+		self.filter_column = "url"
+		self.page_keys = [None]
+		self.page_rows = []
+		self.total_rows = 0
 		self._add_widgets()
 
 	def _add_widgets(self) -> None:
 		'''Add UI widgets to the tab'''
+		# Add a filter bar above the table
+		self._add_filter_bar()
 		# Add a table to show metadata
 		self._add_table()
+		# Add page navigation below the table
+		self._add_pager()
 		# Add a request textbox
 		self._add_request_textbox()
 		# Add a request search entry
@@ -58,23 +70,62 @@ class HistoryTab(tb.Frame):
 		# Add a right click response context menu
 		self._add_response_context_menu()
 
+	def _add_filter_bar(self) -> None:
+		'''Add a column menu and entry to filter the table in SQL'''
+		self.mb_filter = tb.Menubutton(self, text=self.filter_column, bootstyle="secondary")
+		self.mb_filter.place(relx=0.015, rely=0.009, relwidth=0.1, height=30)
+		self.filter_menu = tb.Menu(self.mb_filter)
+		self.filter_str = StringVar(value=self.filter_column)
+		for opt in ["url", "method", "status_code", "input", "type", "extension", "ip addr", "port", "timestamp"]:
+			self.filter_menu.add_radiobutton(label=opt, variable=self.filter_str, command=self._click_filter_column)
+		self.mb_filter['menu'] = self.filter_menu
+		self.filter_entry = tb.Entry(self, text="")
+		self.filter_entry.place(in_=self.mb_filter, relx=1.0, rely=0, x=6, relwidth=7.6, height=30)
+		self.filter_entry.bind("<Return>", self._apply_filter)
+		self.filter_button = tb.Button(self, text="Filter", command=self._apply_filter, bootstyle="warning", width=20)
+		self.filter_button.place(relx=0.906, rely=0.009, relwidth=0.08, height=30)
+
+	def _click_filter_column(self) -> None:
+		'''Select the column the filter applies to'''
+		self.filter_column = self.filter_str.get()
+		self.mb_filter.config(text=self.filter_column)
+
 	def _add_table(self) -> None:
 		'''Add a table to the tab'''
+		# column is the SQL column, like marks columns filtered by substring instead of equality
 		self.cols = [
-			{"text": "id", "stretch": False},
-			{"text":"method","stretch":False},
-			{"text":"url","stretch":True},
-			{"text":"status_code","stretch":False},
-			{"text":"input","stretch":False},
-			{"text":"type","stretch":False},
-			{"text":"extension","stretch":False},
-			{"text":"ip addr","stretch":False},
-			{"text":"port","stretch":False},
-			{"text":"timestamp","stretch":False}
+			{"text": "id", "stretch": False, "column": "id", "like": False},
+			{"text":"method","stretch":False, "column": "request_method", "like": False},
+			{"text":"url","stretch":True, "column": "request_url", "like": True},
+			{"text":"status_code","stretch":False, "column": "response_status_code", "like": False},
+			{"text":"input","stretch":False, "column": "request_has_input", "like": False},
+			{"text":"type","stretch":False, "column": "request_body_type", "like": False},
+			{"text":"extension","stretch":False, "column": "request_file_extension", "like": False},
+			{"text":"ip addr","stretch":False, "column": "ip_address", "like": True},
+			{"text":"port","stretch":False, "column": "port", "like": False},
+			{"text":"timestamp","stretch":False, "column": "timestamp", "like": True}
 		]
-		self.history_table = Tableview(self, paginated=False, autofit=True, bootstyle="warning", coldata=self.cols, rowdata=(), searchable=True)
-		self.history_table.place(relx=0.015, rely=0.009, relwidth=0.971, relheight=0.463)
-		self.history_table.view.bind("<Double-1>", self._double_click_row)
+		self.history_table = tb.Treeview(self, bootstyle="warning", columns=[i["text"] for i in self.cols], show="headings")
+		for col in self.cols:
+			self.history_table.heading(col["text"], text=col["text"], command=lambda c=col["column"]:self._sort_by(c))
+			if col["stretch"]:
+				self.history_table.column(col["text"], width=500, stretch=True)
+			else:
+				self.history_table.column(col["text"], width=90, stretch=False)
+		self.history_table.place(relx=0.015, rely=0.055, relwidth=0.958, relheight=0.37)
+		self.history_scroll = tb.Scrollbar(self, orient="vertical", command=self.history_table.yview, bootstyle="warning round")
+		self.history_scroll.place(relx=0.975, rely=0.055, relwidth=0.011, relheight=0.37)
+		self.history_table.configure(yscrollcommand=self.history_scroll.set)
+		self.history_table.bind("<Double-1>", self._double_click_row)
+
+	def _add_pager(self) -> None:
+		'''Add buttons to move between pages and a label for the current window'''
+		self.prev_button = tb.Button(self, text="< Prev", command=self._prev_page, bootstyle="warning outline", width=10)
+		self.prev_button.place(relx=0.015, rely=0.432, width=90, height=30)
+		self.next_button = tb.Button(self, text="Next >", command=self._next_page, bootstyle="warning outline", width=10)
+		self.next_button.place(in_=self.prev_button, relx=1.0, rely=0, x=6, width=90, height=30)
+		self.page_label = tb.Label(self, text="Rows 0-0 of 0")
+		self.page_label.place(in_=self.next_button, relx=1.0, rely=0, x=12, width=400, height=30)
 
 	def _add_request_textbox(self) -> None:
 		'''Add a request text box'''
@@ -201,46 +252,139 @@ class HistoryTab(tb.Frame):
 			self.notebook.window.fuzz_tab._send_to_fuzzer(self.last_clicked)
 			self.notebook.select(4)
 
+	def _where(self) -> tuple:
+		'''Return the SQL filter clause and its parameters'''
+		value = self.filter_entry.get().strip()
+		if value:
+			for col in self.cols:
+				if col["text"] == self.filter_column:
+					if col["like"]:
+						return (f"{col['column']} LIKE ?", ["%" + value + "%"])
+					return (f"{col['column']} = ?", [value])
+		return ("", [])
+
+	def _fetch_page(self, after_key) -> list:
+		'''Return one page of rows following a (sort value, id) key using keyset pagination'''
+		where, params = self._where()
+		clauses = []
+		if where:
+			clauses.append(where)
+		if self.sort_desc:
+			direction, compare = "DESC", "<"
+		else:
+			direction, compare = "ASC", ">"
+		if after_key:
+			if self.sort_column == "id":
+				clauses.append(f"id {compare} ?")
+				params.append(after_key[1])
+			else:
+				clauses.append(f"({self.sort_column}, id) {compare} (?, ?)")
+				params.extend(after_key)
+		sql = '''SELECT id, request_method, request_url, response_status_code, request_has_input, request_body_type, request_file_extension, ip_address, port, timestamp FROM transactions'''
+		if clauses:
+			sql += " WHERE " + " AND ".join(clauses)
+		if self.sort_column == "id":
+			sql += f" ORDER BY id {direction}"
+		else:
+			sql += f" ORDER BY {self.sort_column} {direction}, id {direction}"
+		sql += " LIMIT ?;"
+		params.append(self.page_size)
+		self.notebook.cursor.execute(sql, params)
+		return self.notebook.cursor.fetchall()
+
+	def _row_key(self, row: tuple) -> tuple:
+		'''Return the (sort value, id) key of a row'''
+		idx = [i["column"] for i in self.cols].index(self.sort_column)
+		return (row[idx], row[0])
+
+	def _count_rows(self) -> int:
+		'''Return the number of rows matching the filter'''
+		where, params = self._where()
+		sql = '''SELECT COUNT(*) FROM transactions'''
+		if where:
+			sql += " WHERE " + where
+		self.notebook.cursor.execute(sql, params)
+		return self.notebook.cursor.fetchone()[0]
+
+	def _show_page(self) -> None:
+		'''Fetch the current page and put only those rows in the table'''
+		self.page_rows = self._fetch_page(self.page_keys[-1])
+		self.history_table.delete(*self.history_table.get_children())
+		for row in self.page_rows:
+			self.history_table.insert("", "end", iid=str(row[0]), values=["" if i is None else i for i in row])
+		first = (len(self.page_keys) - 1) * self.page_size
+		if self.page_rows:
+			window = f"{first + 1}-{first + len(self.page_rows)}"
+		else:
+			window = "0-0"
+		self.page_label.config(text=f"Rows {window} of {self.total_rows}")
+
+	def _next_page(self) -> None:
+		'''Move to the following page'''
+		if self.notebook.cursor and len(self.page_rows) == self.page_size:
+			self.page_keys.append(self._row_key(self.page_rows[-1]))
+			self._show_page()
+
+	def _prev_page(self) -> None:
+		'''Move to the previous page'''
+		if self.notebook.cursor and len(self.page_keys) > 1:
+			self.page_keys.pop()
+			self._show_page()
+
+	def _sort_by(self, column: str) -> None:
+		'''Sort by a column in SQL, clicking the same heading again reverses the order'''
+		if self.notebook.cursor:
+			if column == self.sort_column:
+				self.sort_desc = not self.sort_desc
+			else:
+				self.sort_column = column
+				self.sort_desc = False
+			self.page_keys = [None]
+			self._show_page()
+
+	def _apply_filter(self, event=None) -> None:
+		'''Filter the table in SQL and go back to the first page'''
+		if self.notebook.cursor:
+			self.page_keys = [None]
+			self.total_rows = self._count_rows()
+			self._show_page()
+
 	def _load_table(self) -> None:
-		'''Load table rows from the database'''
-		self.history_table.delete_rows()
-		self.notebook.cursor.execute('''SELECT id, request_method, request_url, response_status_code, request_has_input, request_body_type, request_file_extension, ip_address, port, timestamp FROM transactions;''')
-		rows = self.notebook.cursor.fetchall()
-		if rows:
-			self.history_table.build_table_data(coldata=self.cols, rowdata=rows)
+		'''Load the first page of table rows from the database'''
+		self.page_keys = [None]
+		self.total_rows = self._count_rows()
+		self._show_page()
 
 	def _double_click_row(self, event) -> None:
 		'''Click a row'''
-		try:
-			iid = self.history_table.view.focus()
-			row = self.history_table.get_row(iid=iid)
-		except:
-			row = None
-		if row:
-			if row.values:
-				request_id = row.values[0]
-				if request_id != self.last_clicked:
-					self.last_clicked = request_id
-					self.notebook.cursor.execute('''SELECT request_method, request_url, request_headers, request_body FROM transactions WHERE id = ?;''',(request_id,))
-					request_info = self.notebook.cursor.fetchone()
-					self.notebook.cursor.execute('''SELECT response_status_code, response_status_message, response_headers, response_body FROM transactions WHERE id = ?;''',(request_id,))
-					response_info = self.notebook.cursor.fetchone()
-					raw_request = self.cb.rebuild_request(*request_info)
-					raw_response = self.cb.rebuild_response(*response_info)
-					# Set the text in each pane.
-					### ENABLE DISABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
-					self.request_textbox.__dict__["children"]["!text"].configure(state="normal")
-					self.response_textbox.__dict__["children"]["!text"].configure(state="normal")
-					self.request_textbox.delete(1.0, END)
-					self.response_textbox.delete(1.0, END)
-					self.request_textbox.insert(END, raw_request)
-					self.response_textbox.insert(END, raw_response)
-					### DISABLE ENABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
-					self.request_textbox.__dict__["children"]["!text"].configure(state="disabled")
-					self.response_textbox.__dict__["children"]["!text"].configure(state="disabled")
-					# Perform searches
-					self._search_request(True)
-					self._search_response(True)
+		iid = self.history_table.focus()
+		if iid:
+			request_id = int(iid)
+			if request_id != self.last_clicked:
+				self.last_clicked = request_id
+				self.notebook.cursor.execute('''SELECT t.request_method, t.request_url, t.request_headers, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.request_body_hash WHERE t.id = ?;''',(request_id,))
+				request_info = self.notebook.cursor.fetchone()
+				self.notebook.cursor.execute('''SELECT t.response_status_code, t.response_status_message, t.response_headers, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.response_body_hash WHERE t.id = ?;''',(request_id,))
+				response_info = self.notebook.cursor.fetchone()
+				# Bodies are only decompressed once their row is opened
+				method, url, headers, body = request_info
+				raw_request = self.cb.rebuild_request(method, url, headers, self.bs.decode(body))
+				status_code, msg, headers, body = response_info
+				raw_response = self.cb.rebuild_response(status_code, msg, headers, self.bs.decode(body))
+				# Set the text in each pane.
+				### ENABLE DISABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
+				self.request_textbox.__dict__["children"]["!text"].configure(state="normal")
+				self.response_textbox.__dict__["children"]["!text"].configure(state="normal")
+				self.request_textbox.delete(1.0, END)
+				self.response_textbox.delete(1.0, END)
+				self.request_textbox.insert(END, raw_request)
+				self.response_textbox.insert(END, raw_response)
+				### DISABLE ENABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
+				self.request_textbox.__dict__["children"]["!text"].configure(state="disabled")
+				self.response_textbox.__dict__["children"]["!text"].configure(state="disabled")
+				# Perform searches
+				self._search_request(True)
+				self._search_response(True)
 
 	def _search_request(self, new_click_target: bool=False):
 		'''Search the request'''
@@ -0,0 +1,55 @@
+#! /usr/bin/env python3
+
+import mmap
+from array import array
+
+class PayloadFile:
+
+	def __init__(self, path: str) -> None:
+		'''Initialize a payload file read through mmap, only the offsets of its lines are kept in memory'''
+		self.path = path
+		self.f = open(path, "rb")
+		self.size = self.f.seek(0, 2)
+		self.mm = None
+		# Start offset of every line then the end of the file, 4 bytes per line below 4 GB
+		self.offsets = array("I" if self.size < 2**32 else "Q")
+		if self.size:
+			self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+			self._index_lines()
+		self.offsets.append(self.size)
+
+	def _index_lines(self) -> None:
+		'''Record where each line starts, a trailing newline does not start another line'''
+		find = self.mm.find
+		append = self.offsets.append
+		start = 0
+		while start < self.size:
+			append(start)
+			end = find(b"\n", start)
+			if end < 0:
+				break
+			start = end + 1
+
+	def __len__(self) -> int:
+		'''Return the number of payloads'''
+		return len(self.offsets) - 1
+
+	def __getitem__(self, index: int) -> str:
+		'''Return the payload on a line, stripped like lines read from a text file'''
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError("Payload index out of range")
+		return self.mm[self.offsets[index]:self.offsets[index+1]].decode("utf-8", "replace").strip()
+
+	def __iter__(self):
+		'''Yield every payload in file order'''
+		for i in range(len(self)):
+			yield self[i]
+
+	def close(self) -> None:
+		'''Release the mapping and the file'''
+		if self.mm:
+			self.mm.close()
+			self.mm = None
+		self.f.close()
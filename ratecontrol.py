@@ -0,0 +1,156 @@
+#! /usr/bin/env python3
+
+import time
+import threading
+
+class TokenBucket:
+
+	def __init__(self, rate: float=0) -> None:
+		'''Initialize a requests per second cap shared by every worker, a rate of 0 is unlimited'''
+		self.lock = threading.Lock()
+		self.rate = 0.0
+		self.burst = 1.0
+		self.tokens = 1.0
+		self.updated = time.monotonic()
+		self.set_rate(rate)
+
+	def _refill(self, now: float) -> None:
+		'''Add the tokens earned since the last update'''
+		if self.rate > 0:
+			self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	def set_rate(self, rate: float) -> None:
+		'''Change the rate, tokens already earned are kept up to the new burst size'''
+		with self.lock:
+			self._refill(time.monotonic())
+			self.rate = max(0.0, float(rate))
+			# A tenth of a second worth of requests may go out at once
+			self.burst = max(1.0, self.rate / 10)
+			self.tokens = min(self.tokens, self.burst)
+
+	def reserve(self) -> float:
+		'''Take a token and return the seconds to wait before sending, waiting workers queue up behind each other'''
+		with self.lock:
+			if self.rate <= 0:
+				return 0.0
+			self._refill(time.monotonic())
+			self.tokens -= 1
+			if self.tokens >= 0:
+				return 0.0
+			return -self.tokens / self.rate
+
+class AIMDController:
+
+	def __init__(self, max_limit: int, bucket: TokenBucket, max_rate: float=0, min_limit: int=1, decrease: float=0.5, rtt_factor: float=3.0, cooldown: float=1.0) -> None:
+		'''Initialize a controller that grows concurrency and rate while the target is healthy and halves them when it is not'''
+		self.cond = threading.Condition()
+		self.bucket = bucket
+		self.max_limit = max(1, max_limit)
+		self.min_limit = max(1, min(min_limit, self.max_limit))
+		self.max_rate = max_rate
+		self.decrease = decrease
+		self.rtt_factor = rtt_factor
+		self.cooldown = cooldown
+		# Doubles every window until the first back off, then grows by one
+		self.limit = min(self.max_limit, max(self.min_limit, 4))
+		self.slow_start = True
+		self.in_flight = 0
+		self.successes = 0
+		self.baseline_rtt = 0.0
+		self.last_decrease = 0.0
+		self.window_start = time.monotonic()
+		self.window_count = 0
+		self.throughput = 0.0
+		self.peak_throughput = 0.0
+		self.backoffs = 0
+
+	def try_acquire(self) -> bool:
+		'''Take a concurrency slot if one is free'''
+		with self.cond:
+			if self.in_flight < self.limit:
+				self.in_flight += 1
+				return True
+			return False
+
+	def acquire(self, timeout: float=None) -> bool:
+		'''Wait for a concurrency slot, return False if the timeout passed first'''
+		with self.cond:
+			if not self.cond.wait_for(lambda: self.in_flight < self.limit, timeout):
+				return False
+			self.in_flight += 1
+			return True
+
+	def release(self, status_code: int, rtt: float, failed: bool) -> None:
+		'''Free a slot and adjust the limits from the outcome of a request'''
+		with self.cond:
+			self.in_flight -= 1
+			now = time.monotonic()
+			self._count(now)
+			if self._is_congested(status_code, rtt, failed):
+				self._back_off(now)
+			else:
+				self._update_baseline(rtt)
+				self.successes += 1
+				# Roughly once per round trip of the whole window
+				if self.successes >= self.limit:
+					self._grow()
+			self.cond.notify_all()
+
+	def _count(self, now: float) -> None:
+		'''Measure completed requests per second over one second windows'''
+		self.window_count += 1
+		elapsed = now - self.window_start
+		if elapsed >= 1.0:
+			self.throughput = self.window_count / elapsed
+			self.peak_throughput = max(self.peak_throughput, self.throughput)
+			self.window_start = now
+			self.window_count = 0
+
+	def _is_congested(self, status_code: int, rtt: float, failed: bool) -> bool:
+		'''Return True for throttling responses, timeouts, connection errors and RTT spikes'''
+		if failed or status_code in (429, 503):
+			return True
+		return self.baseline_rtt > 0 and rtt > self.baseline_rtt * self.rtt_factor and rtt > 0.05
+
+	def _update_baseline(self, rtt: float) -> None:
+		'''Track a slow moving average of healthy round trip times'''
+		if self.baseline_rtt == 0:
+			self.baseline_rtt = rtt
+		else:
+			self.baseline_rtt = self.baseline_rtt * 0.95 + rtt * 0.05
+
+	def _back_off(self, now: float) -> None:
+		'''Multiplicatively cut concurrency and rate, at most once per cooldown'''
+		self.successes = 0
+		if now - self.last_decrease < self.cooldown:
+			return
+		self.last_decrease = now
+		self.slow_start = False
+		self.backoffs += 1
+		self.limit = max(self.min_limit, int(self.limit * self.decrease))
+		current = self.bucket.rate or self.throughput
+		if current > 0:
+			self.bucket.set_rate(max(1.0, current * self.decrease))
+
+	def _grow(self) -> None:
+		'''Additively raise concurrency and rate toward their caps'''
+		self.successes = 0
+		if self.slow_start:
+			self.limit = min(self.max_limit, self.limit * 2)
+		else:
+			self.limit = min(self.max_limit, self.limit + 1)
+		rate = self.bucket.rate
+		if rate > 0:
+			rate += max(1.0, rate * 0.05)
+			if self.max_rate:
+				rate = min(rate, self.max_rate)
+			elif rate >= self.peak_throughput * 2:
+				# Well past anything the target has sustained, stop pacing altogether
+				rate = 0
+			self.bucket.set_rate(rate)
+
+	def state(self) -> dict:
+		'''Return the current limits for display'''
+		with self.cond:
+			return {"limit": self.limit, "rate": round(self.bucket.rate, 1), "backoffs": self.backoffs}
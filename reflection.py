@@ -0,0 +1,117 @@
+#! /usr/bin/env python3
+
+import re
+import html
+import json
+import urllib.parse
+from collections import deque
+
+class ReflectionAnalyzer:
+
+	def __init__(self) -> None:
+		'''Initialize a reflection analyzer for the raw, sent and commonly escaped forms of payloads'''
+		# Checked in this order when two forms of a payload are the same bytes
+		self.variants = {
+			"raw": lambda payload: payload,
+			"html": lambda payload: html.escape(payload),
+			"html_noquote": lambda payload: html.escape(payload, quote=False),
+			"url": lambda payload: urllib.parse.quote_plus(payload),
+			"url_path": lambda payload: urllib.parse.quote(payload),
+			"url_decoded": lambda payload: urllib.parse.unquote_plus(payload),
+			"json": lambda payload: json.dumps(payload, ensure_ascii=False)[1:-1],
+			"json_ascii": lambda payload: json.dumps(payload)[1:-1]
+		}
+		# Automata by payload tuple, battering ram and repeated payloads reuse theirs
+		self.automata = {}
+		self.max_automata = 256
+
+	def compile(self, payloads: tuple, sent: tuple=()) -> tuple:
+		'''Return an automaton matching every form of the payloads and a map of matched bytes to (variant, payload), built once per payload tuple'''
+		key = (payloads, sent)
+		compiled = self.automata.get(key)
+		if compiled:
+			return compiled
+		forms = {}
+		for i, payload in enumerate(payloads):
+			candidates = [("raw", payload)]
+			# The encoded form actually placed in the request
+			if i < len(sent):
+				candidates.append(("sent", sent[i]))
+			candidates.extend((name, variant(payload)) for name, variant in self.variants.items() if name != "raw")
+			for name, text in candidates:
+				form = text.encode("utf-8", "replace")
+				# An empty payload would match every response
+				if form and form not in forms:
+					forms[form] = (name, payload)
+		compiled = (self._build(forms) if forms else None, forms)
+		if len(self.automata) >= self.max_automata:
+			self.automata = {}
+		self.automata[key] = compiled
+		return compiled
+
+	def _build(self, forms: dict) -> tuple:
+		'''Return (goto, fail, out, first byte pattern, longest form) of an Aho-Corasick trie over the forms'''
+		goto = [{}]
+		out = [[]]
+		for form in forms:
+			state = 0
+			for byte in form:
+				next_state = goto[state].get(byte)
+				if next_state is None:
+					next_state = len(goto)
+					goto.append({})
+					out.append([])
+					goto[state][byte] = next_state
+				state = next_state
+			out[state].append(form)
+		# Breadth first so a state's failure link is final before its children need it
+		fail = [0] * len(goto)
+		pending = deque(goto[0].values())
+		while pending:
+			state = pending.popleft()
+			for byte, next_state in goto[state].items():
+				pending.append(next_state)
+				link = fail[state]
+				while link and byte not in goto[link]:
+					link = fail[link]
+				fail[next_state] = goto[link].get(byte, 0)
+				out[next_state] = out[next_state] + out[fail[next_state]]
+		# Lets the scan skip in C to the next byte that can start a form
+		first = re.compile(b"[" + b"".join(re.escape(bytes((byte,))) for byte in sorted(goto[0])) + b"]")
+		return (goto, fail, out, first, max(len(form) for form in forms))
+
+	def scan(self, content: bytes, payloads: tuple, sent: tuple=()) -> tuple:
+		'''Return (variant, payload, offset) of the leftmost, then longest, reflected form in one pass over content, or an empty tuple'''
+		automaton, forms = self.compile(payloads, sent)
+		if automaton is None or not content:
+			return ()
+		goto, fail, out, first, longest = automaton
+		best = None
+		state = 0
+		i = 0
+		end = len(content)
+		while i < end:
+			if state == 0:
+				# Nothing in progress, so no later match can start before one already found
+				if best:
+					break
+				match = first.search(content, i)
+				if not match:
+					break
+				i = match.start()
+			byte = content[i]
+			while state and byte not in goto[state]:
+				state = fail[state]
+			state = goto[state].get(byte, 0)
+			for form in out[state]:
+				start = i - len(form) + 1
+				if best is None or start < best[0] or (start == best[0] and len(form) > len(best[1])):
+					best = (start, form)
+			# A match starting earlier would have ended by now
+			if best and i >= best[0] + longest - 1:
+				break
+			i += 1
+		if not best:
+			return ()
+		variant, payload = forms[best[1]]
+		return (variant, payload, best[0])
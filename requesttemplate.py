@@ -0,0 +1,81 @@
+#! /usr/bin/env python3
+
+import re
+import string
+
+class RequestTemplate:
+
+	def __init__(self, template: str) -> None:
+		'''Initialize a raw request template with {n} payload slots, parsed once into its parts'''
+		self.template = template
+		self.num_of_slots = 0
+		# Slots stand in as markers while the request is split, payloads never change its structure
+		self.marker = re.compile("\x00(\\d+)\x00")
+		marked = self._mark_slots(template)
+		self.raw_request = self._segments(marked)
+		self.method = ""
+		self.url = ""
+		self.headers = []
+		self.body = ""
+		self._parse(marked)
+
+	def _mark_slots(self, template: str) -> str:
+		'''Return the template with escaped braces restored and every slot replaced by a marker'''
+		parts = []
+		auto_number = 0
+		for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+			parts.append(literal)
+			if field_name is None:
+				continue
+			if field_name == "":
+				field_name = str(auto_number)
+				auto_number += 1
+			if not field_name.isdigit():
+				raise ValueError(f"Invalid payload slot: {{{field_name}}}")
+			self.num_of_slots = max(self.num_of_slots, int(field_name) + 1)
+			parts.append("\x00" + field_name + "\x00")
+		return "".join(parts)
+
+	def _segments(self, text: str) -> tuple:
+		'''Return text split into literal strings and slot numbers'''
+		segments = []
+		for i, part in enumerate(self.marker.split(text)):
+			if i % 2:
+				segments.append(int(part))
+			elif part:
+				segments.append(part)
+		# Text without slots is kept as a plain string
+		if len(segments) == 1 and isinstance(segments[0], str):
+			return segments[0]
+		return tuple(segments)
+
+	def _parse(self, marked: str) -> None:
+		'''Split a marked template into the request line, headers and body'''
+		lines = re.split(r"\r?\n", marked)
+		method, url, version = re.split(r"\s+", lines[0], 2)
+		self.method = self._segments(method)
+		self.url = self._segments(url)
+		i = 0
+		for i in range(1, len(lines)):
+			if re.search(r":\s", lines[i]):
+				name, value = re.split(r":\s+", lines[i], 1)
+				self.headers.append((self._segments(name), self._segments(value)))
+			else:
+				break
+		self.body = self._segments("\n".join(lines[i+1:]))
+
+	def _fill(self, segments, values: list) -> str:
+		'''Return segments with their slots filled in'''
+		if isinstance(segments, str):
+			return segments
+		return "".join(values[i] if isinstance(i, int) else i for i in segments)
+
+	def fill(self, values: list) -> dict:
+		'''Return request data with a value in each slot'''
+		return {
+			"method": self._fill(self.method, values),
+			"url": self._fill(self.url, values),
+			"headers": {self._fill(name, values): self._fill(value, values) for name, value in self.headers},
+			"data": self._fill(self.body, values),
+			"raw_request": self._fill(self.raw_request, values)
+		}
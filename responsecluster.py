@@ -0,0 +1,152 @@
+#! /usr/bin/env python3
+
+import re
+import hashlib
+import sqlite3
+from collections import Counter
+
+class ResponseClusterer:
+
+	def __init__(self, max_distance: int=3, max_word_ratio: float=0.1) -> None:
+		'''Initialize incremental clustering of fuzz responses by status, header names and a simhash of the body'''
+		self.max_distance = max_distance
+		self.max_word_ratio = max_word_ratio
+		# Enough of a body to tell pages apart, and few enough words that no counter field overflows
+		self.max_body = 1000000
+		self.tokens = re.compile(r"[^\W\d_]+")
+		# Headers whose presence changes between otherwise identical responses
+		self.volatile_headers = {"date", "age", "expires", "last-modified", "etag", "content-length", "transfer-encoding", "connection", "keep-alive"}
+		# Each of the 64 hash bits gets a 24 bit counter field, so weights can be summed for all bits with integer adds
+		self.field_bits = 24
+		self.field_mask = (1 << self.field_bits) - 1
+		self.spread_table = [self._spread_byte(i) for i in range(256)]
+		# With one more band than the allowed distance, a close simhash equals a cluster's in at least one band
+		self.num_bands = max_distance + 1
+		self.band_bits = 64 // self.num_bands
+		self.run_id = 0
+		self.bands = {}
+		self.sizes = {}
+		self.changed = set()
+		self.new_clusters = []
+		self.next_id = 1
+
+	def _spread_byte(self, value: int) -> int:
+		'''Return a byte with each bit moved to the bottom of its own counter field'''
+		spread = 0
+		for bit in range(8):
+			if value >> bit & 1:
+				spread |= 1 << (bit * self.field_bits)
+		return spread
+
+	def simhash(self, counts: Counter) -> int:
+		'''Return the 64 bit simhash of weighted tokens'''
+		table = self.spread_table
+		shift = 8 * self.field_bits
+		total = 0
+		weights = 0
+		for token, weight in counts.items():
+			h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+			spread = 0
+			for i in range(8):
+				spread |= table[h >> (i * 8) & 0xFF] << (i * shift)
+			total += spread * weight
+			weights += weight
+		simhash = 0
+		for bit in range(64):
+			# A bit is set when tokens setting it outweigh the ones clearing it
+			if (total >> (bit * self.field_bits) & self.field_mask) * 2 > weights:
+				simhash |= 1 << bit
+		return simhash
+
+	def fingerprint(self, status_code: str, headers: dict, body: bytes, payloads: tuple) -> tuple:
+		'''Return (simhash, word count, header key) of a response, payloads and numbers are left out so they do not split clusters'''
+		text = body[:self.max_body].decode("utf-8", "replace").lower()
+		for payload in payloads:
+			if payload:
+				text = text.replace(payload.lower(), " ")
+		words = self.tokens.findall(text)
+		# Capped weights keep one repeated word from deciding the hash
+		counts = Counter(words)
+		for token, weight in counts.items():
+			if weight > 16:
+				counts[token] = 16
+		names = sorted(set(name.lower() for name in headers) - self.volatile_headers)
+		header_key = status_code + ":" + hashlib.blake2b("\n".join(names).encode("utf-8"), digest_size=4).hexdigest()
+		return (self.simhash(counts), len(words), header_key)
+
+	def error_fingerprint(self, error: str) -> tuple:
+		'''Return the fingerprint of a request that got no response'''
+		return (0, 0, "000:" + error)
+
+	def to_signed(self, value: int) -> int:
+		'''Return a 64 bit hash as a signed value SQLite can store'''
+		return value - (1 << 64) if value >= 1 << 63 else value
+
+	def load(self, cursor: sqlite3.Cursor, run_id: int) -> None:
+		'''Start clustering a run, clusters already stored for it are kept'''
+		self.run_id = run_id
+		self.bands = {}
+		self.sizes = {}
+		self.changed = set()
+		self.new_clusters = []
+		self.next_id = cursor.execute('''SELECT COALESCE(MAX(id), 0) FROM fuzz_clusters;''').fetchone()[0] + 1
+		cursor.execute('''SELECT id, header_key, simhash, word_count, size FROM fuzz_clusters WHERE run_id = ? ORDER BY id;''', (run_id,))
+		for cluster_id, header_key, simhash, word_count, size in cursor.fetchall():
+			self._index(header_key, (cluster_id, simhash & ((1 << 64) - 1), word_count))
+			self.sizes[cluster_id] = size
+
+	def _band_keys(self, header_key: str, simhash: int) -> list:
+		'''Return the band index keys of a simhash, the last band takes the bits left over'''
+		keys = []
+		for band in range(self.num_bands):
+			bits = self.band_bits if band < self.num_bands - 1 else 64 - band * self.band_bits
+			keys.append((header_key, band, simhash >> (band * self.band_bits) & ((1 << bits) - 1)))
+		return keys
+
+	def _index(self, header_key: str, cluster: tuple) -> None:
+		'''Add a (cluster id, simhash, word count) to the band index'''
+		for key in self._band_keys(header_key, cluster[1]):
+			self.bands.setdefault(key, []).append(cluster)
+
+	def assign(self, fingerprint: tuple, fuzz_id: int) -> int:
+		'''Return the cluster of a response, starting a new one if no cluster is close enough'''
+		simhash, word_count, header_key = fingerprint
+		# Only clusters sharing a band can be close enough, the oldest match wins as in a linear scan
+		match = 0
+		for key in self._band_keys(header_key, simhash):
+			for cluster_id, cluster_hash, cluster_words in self.bands.get(key, ()):
+				if match and cluster_id >= match:
+					break
+				if bin(simhash ^ cluster_hash).count("1") <= self.max_distance and abs(word_count - cluster_words) <= max(2, cluster_words * self.max_word_ratio):
+					match = cluster_id
+					break
+		if match:
+			self.sizes[match] += 1
+			self.changed.add(match)
+			return match
+		cluster_id = self.next_id
+		self.next_id += 1
+		# The first response of a cluster stays its representative
+		self._index(header_key, (cluster_id, simhash, word_count))
+		self.sizes[cluster_id] = 1
+		self.new_clusters.append((cluster_id, self.run_id, fuzz_id, header_key, self.to_signed(simhash), word_count))
+		return cluster_id
+
+	def save(self, cursor: sqlite3.Cursor) -> None:
+		'''Write clusters created or grown since the last save'''
+		if self.new_clusters:
+			cursor.executemany('''INSERT INTO fuzz_clusters (id, run_id, representative, header_key, simhash, word_count, size) VALUES (?,?,?,?,?,?,1);''', self.new_clusters)
+		if self.changed:
+			cursor.executemany('''UPDATE fuzz_clusters SET size = ? WHERE id = ?;''', [(self.sizes[cluster_id], cluster_id) for cluster_id in self.changed])
+		self.new_clusters = []
+		self.changed = set()
+
+	def ranked(self, cursor: sqlite3.Cursor, run_id: int, limit: int=-1) -> list:
+		'''Return the fuzz table row of each cluster's representative with "id (size)" as its cluster, rarest first'''
+		cursor.execute('''SELECT f.id, f.status_code, f.rtt, f.content_length, f.payloads, f.reflected, f.timeout, f.errors, f.timestamp, f.reflection, c.id || ' (' || c.size || ')'
+			FROM fuzz_clusters c JOIN fuzz f ON f.id = c.representative WHERE c.run_id = ? ORDER BY c.size, c.id LIMIT ?;''', (run_id, limit))
+		return cursor.fetchall()
+
+	def delete_run(self, cursor: sqlite3.Cursor, run_id: int) -> None:
+		'''Remove the clusters of a run'''
+		cursor.execute('''DELETE FROM fuzz_clusters WHERE run_id = ?;''', (run_id,))
@@ -0,0 +1,130 @@
+#! /usr/bin/env python3
+
+import re
+import sqlite3
+import bodystore
+
+class SearchIndex:
+
+	def __init__(self, batch_size: int=500) -> None:
+		'''Initialize the full-text index over transactions, bodies and fuzz responses'''
+		self.batch_size = batch_size
+		self.bs = bodystore.BodyStore()
+		self.snippet_width = 60
+		# Snippets come from the start of a body, a match further in shows the start instead
+		self.snippet_scan = 65536
+
+	def create(self, cursor: sqlite3.Cursor) -> None:
+		'''Create the contentless FTS5 tables, rowids point back at the source tables'''
+		cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(request_url, request_headers, response_headers, content='');''')
+		# Bodies are indexed once per distinct body, not once per transaction
+		cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS bodies_fts USING fts5(content, content='');''')
+		cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS fuzz_fts USING fts5(raw_response, content='');''')
+
+	def available(self, cursor: sqlite3.Cursor) -> bool:
+		'''Return True if the database has the full-text index'''
+		cursor.execute('''SELECT name FROM sqlite_master WHERE name = 'transactions_fts';''')
+		return cursor.fetchone() is not None
+
+	def last_rowid(self, cursor: sqlite3.Cursor, table: str) -> int:
+		'''Return the highest rowid of a table so newly inserted rows can be found'''
+		return cursor.execute(f'''SELECT COALESCE(MAX(rowid), 0) FROM {table};''').fetchone()[0]
+
+	def searchable_text(self, value) -> str:
+		'''Return the text of a stored body worth indexing, base64 binary data is left out'''
+		text = self.bs.decode(value)
+		if not text:
+			return ""
+		start = text.find(self.bs.binary_start)
+		if start != -1 and text.endswith(self.bs.binary_end):
+			return text[:start]
+		return text
+
+	def snippet_text(self, value) -> str:
+		'''Return the start of a stored body's searchable text, enough to build a snippet from'''
+		text = self.bs.decode_prefix(value, self.snippet_scan)
+		if not text:
+			return ""
+		start = text.find(self.bs.binary_start)
+		if start != -1:
+			return text[:start]
+		return text
+
+	def index_transactions(self, cursor: sqlite3.Cursor, after_id: int) -> None:
+		'''Index the url and headers of transactions inserted after a given id'''
+		cursor.execute('''INSERT INTO transactions_fts (rowid, request_url, request_headers, response_headers)
+			SELECT id, request_url, request_headers, response_headers FROM transactions WHERE id > ?;''', (after_id,))
+
+	def index_bodies(self, cursor: sqlite3.Cursor, after_rowid: int) -> None:
+		'''Index bodies inserted after a given rowid'''
+		while 1:
+			rows = cursor.execute('''SELECT rowid, content FROM bodies WHERE rowid > ? ORDER BY rowid LIMIT ?;''', (after_rowid, self.batch_size)).fetchall()
+			if not rows:
+				break
+			cursor.executemany('''INSERT INTO bodies_fts (rowid, content) VALUES (?,?);''', [(rowid, self.searchable_text(content)) for rowid, content in rows])
+			after_rowid = rows[-1][0]
+
+	def index_fuzz(self, cursor: sqlite3.Cursor, rows: list) -> None:
+		'''Index (fuzz id, raw response text) pairs'''
+		cursor.executemany('''INSERT INTO fuzz_fts (rowid, raw_response) VALUES (?,?);''', rows)
+
+	def delete_fuzz(self, cursor: sqlite3.Cursor, rows: list) -> None:
+		'''Remove (fuzz id, raw response text) pairs, a contentless index needs the indexed text to delete it'''
+		cursor.executemany('''INSERT INTO fuzz_fts (fuzz_fts, rowid, raw_response) VALUES ('delete',?,?);''', rows)
+
+	def rebuild(self, cursor: sqlite3.Cursor) -> None:
+		'''Index everything already stored in the database'''
+		self.index_transactions(cursor, 0)
+		self.index_bodies(cursor, 0)
+		after_id = 0
+		while 1:
+			rows = cursor.execute('''SELECT id, raw_response FROM fuzz WHERE id > ? ORDER BY id LIMIT ?;''', (after_id, self.batch_size)).fetchall()
+			if not rows:
+				break
+			self.index_fuzz(cursor, [(rowid, self.searchable_text(raw_response)) for rowid, raw_response in rows])
+			after_id = rows[-1][0]
+
+	def _match_expression(self, query: str, raw: bool) -> str:
+		'''Return an FTS5 MATCH expression, plain input is searched as a phrase'''
+		if raw:
+			return query
+		return '"' + query.replace('"', '""') + '"'
+
+	def search(self, cursor: sqlite3.Cursor, query: str, raw: bool=False, include_fuzz: bool=False, limit: int=500) -> list:
+		'''Return (source, id, field) for rows matching the query, transactions first'''
+		expression = self._match_expression(query, raw)
+		results = []
+		cursor.execute('''SELECT id, field FROM (
+				SELECT rowid AS id, 'url/headers' AS field FROM transactions_fts WHERE transactions_fts MATCH ?1
+				UNION ALL
+				SELECT t.id, 'request body' FROM bodies_fts f JOIN bodies b ON b.rowid = f.rowid JOIN transactions t ON t.request_body_hash = b.hash WHERE bodies_fts MATCH ?1
+				UNION ALL
+				SELECT t.id, 'response body' FROM bodies_fts f JOIN bodies b ON b.rowid = f.rowid JOIN transactions t ON t.response_body_hash = b.hash WHERE bodies_fts MATCH ?1
+			) ORDER BY id LIMIT ?2;''', (expression, limit))
+		for rowid, field in cursor.fetchall():
+			results.append(("transaction", rowid, field))
+		if include_fuzz and len(results) < limit:
+			cursor.execute('''SELECT rowid FROM fuzz_fts WHERE fuzz_fts MATCH ? ORDER BY rowid LIMIT ?;''', (expression, limit - len(results)))
+			for (rowid,) in cursor.fetchall():
+				results.append(("fuzz", rowid, "response"))
+		return results
+
+	def snippet(self, text: str, query: str) -> str:
+		'''Return a short single-line excerpt around the first query term found in the text'''
+		if not text:
+			return ""
+		terms = [i for i in re.split(r"\W+", query) if i and i.upper() not in ("AND", "OR", "NOT", "NEAR")]
+		start = -1
+		for term in terms:
+			mat = re.search(re.escape(term), text, re.I)
+			if mat:
+				start = mat.start()
+				break
+		if start == -1:
+			start = 0
+		begin = max(0, start - self.snippet_width // 2)
+		excerpt = text[begin:begin + self.snippet_width * 2]
+		excerpt = re.sub(r"\s+", " ", excerpt)
+		if begin > 0:
+			excerpt = "..." + excerpt
+		return excerpt
@@ -0,0 +1,184 @@
+#! /usr/bin/env python3
+
+import time
+import sqlite3
+from tkinter import *
+import ttkbootstrap as tb
+import bodystore
+import searchindex
+
+##################
+### SEARCH TAB ###
+##################
+class SearchTab(tb.Frame):
+
+	def __init__(self, notebook: tb.Notebook) -> None:
+		'''Initialize the global search tab'''
+		self.notebook = notebook
+		super().__init__(self.notebook)
+		self.notebook.add(self, text="Search") # Add itself to the notebook
+		self.si = searchindex.SearchIndex()
+		self.bs = bodystore.BodyStore()
+		self.results = {}
+		self.last_clicked = -1
+		self._add_widgets()
+
+	def _add_widgets(self) -> None:
+		'''Add widgets to the frame'''
+		# Add the search entry
+		self._add_search_entry()
+		# Add the search button
+		self._add_search_button()
+		# Add a toggle to use FTS5 query syntax
+		self._add_toggle_syntax()
+		# Add a toggle to include fuzz results
+		self._add_toggle_fuzz()
+		# Add a label for the number of matches and query time
+		self._add_search_count_label()
+		# Add the results tree
+		self._add_results_tree()
+		# Add the right click menu for transaction results
+		self._add_result_context_menu()
+
+	def _add_search_entry(self) -> None:
+		'''Add the global search entry'''
+		self.search_entry = tb.Entry(self, text="")
+		self.search_entry.place(relx=0.015, rely=0.015, relwidth=0.88, height=30)
+		self.search_entry.bind("<Return>", self._search)
+
+	def _add_search_button(self) -> None:
+		'''Add a button to run the search'''
+		self.search_button = tb.Button(self, text="Search", command=self._search, bootstyle="success", width=20)
+		self.search_button.place(relx=0.905, rely=0.015, relwidth=0.08, height=30)
+
+	def _add_toggle_syntax(self) -> None:
+		'''Add a toggle button to pass the query to FTS5 as is'''
+		self.syntax_toggle_int = IntVar()
+		self.search_syntax = tb.Checkbutton(self, text="FTS Syntax", variable=self.syntax_toggle_int, style="success.Roundtoggle.Toolbutton")
+		self.search_syntax.place(in_=self.search_entry, relx=0, rely=1.0, width=110, height=30)
+
+	def _add_toggle_fuzz(self) -> None:
+		'''Add a toggle button to include fuzz responses'''
+		self.fuzz_toggle_int = IntVar()
+		self.search_fuzz = tb.Checkbutton(self, text="Include Fuzz Results", variable=self.fuzz_toggle_int, style="success.Roundtoggle.Toolbutton")
+		self.search_fuzz.place(in_=self.search_syntax, relx=1.0, rely=0, width=170, height=30)
+
+	def _add_search_count_label(self) -> None:
+		'''Add a label for the number of matches'''
+		self.search_count = tb.Label(self, text="Matches: 0")
+		self.search_count.place(in_=self.search_fuzz, relx=1.0, rely=0, width=300, height=30)
+
+	def _add_results_tree(self) -> None:
+		'''Add a tree listing matching rows and snippets'''
+		self.results_tree = tb.Treeview(self, bootstyle="success", columns=("source", "id", "field", "snippet"), show="headings")
+		self.results_tree.heading("source", text="source")
+		self.results_tree.heading("id", text="id")
+		self.results_tree.heading("field", text="field")
+		self.results_tree.heading("snippet", text="snippet")
+		self.results_tree.column("source", width=100, stretch=False)
+		self.results_tree.column("id", width=80, stretch=False)
+		self.results_tree.column("field", width=120, stretch=False)
+		self.results_tree.column("snippet", stretch=True)
+		self.results_tree.place(relx=0.015, rely=0.1, relwidth=0.971, relheight=0.88)
+		self.results_tree.bind("<Double-1>", self._double_click_row)
+		self.results_tree.bind("<Button-3>", self._right_click_result)
+
+	def _add_result_context_menu(self) -> None:
+		'''Add a right click menu on a target to show a menu'''
+		self.mu_result = Menu(self, tearoff=False)
+		self.mu_result.add_command(label="Open in Editor", command=self._send_to_editor)
+		self.mu_result.add_command(label="Open in Fuzzer", command=self._send_to_fuzzer)
+		self.mu_result.bind("<FocusOut>", self._close_result_menu)
+
+	def _close_result_menu(self, event=None) -> None:
+		'''Close the right click menu if you left click off it'''
+		self.mu_result.unpost()
+
+	def _right_click_result(self, event) -> None:
+		'''Open the right click popup window'''
+		iid = self.results_tree.identify_row(event.y)
+		if iid:
+			self.results_tree.selection_set(iid)
+			self.results_tree.focus(iid)
+			source, rowid = self.results[iid]
+			if source == "transaction":
+				self.last_clicked = rowid
+				try:
+					self.mu_result.tk_popup(event.x_root + 1, event.y_root + 1)
+				finally:
+					self.mu_result.grab_release()
+
+	def _send_to_editor(self) -> None:
+		'''Send request to editor'''
+		if self.last_clicked != -1:
+			self.notebook.window.edit_view._send_to_editor(self.last_clicked)
+			self.notebook.select(3)
+
+	def _send_to_fuzzer(self) -> None:
+		'''Send request to fuzzer'''
+		if self.last_clicked != -1:
+			self.notebook.window.fuzz_tab._send_to_fuzzer(self.last_clicked)
+			self.notebook.select(4)
+
+	def _double_click_row(self, event) -> None:
+		'''Open a transaction in the editor or a fuzz result in the fuzzer'''
+		iid = self.results_tree.focus()
+		if iid in self.results:
+			source, rowid = self.results[iid]
+			if source == "transaction":
+				self.last_clicked = rowid
+				self._send_to_editor()
+			else:
+				self.notebook.window.fuzz_tab._switch_pane(1)
+				self.notebook.window.fuzz_tab._show_result(rowid)
+				self.notebook.select(4)
+
+	def _field_text(self, source: str, rowid: int, field: str, bodies: dict) -> str:
+		'''Return the start of the field that matched for building a snippet, bodies caches texts by hash during one search'''
+		cursor = self.notebook.cursor
+		if source == "fuzz":
+			cursor.execute('''SELECT raw_response FROM fuzz WHERE id = ?;''', (rowid,))
+		elif field in ("request body", "response body"):
+			column = "request_body_hash" if field == "request body" else "response_body_hash"
+			row = cursor.execute(f'''SELECT {column} FROM transactions WHERE id = ?;''', (rowid,)).fetchone()
+			if not row or row[0] is None:
+				return ""
+			# Transactions sharing a body decode it once
+			if row[0] not in bodies:
+				cursor.execute('''SELECT content FROM bodies WHERE hash = ?;''', (row[0],))
+				content = cursor.fetchone()
+				bodies[row[0]] = self.si.snippet_text(content[0]) if content else ""
+			return bodies[row[0]]
+		else:
+			cursor.execute('''SELECT request_url || ' ' || request_headers || ' ' || response_headers FROM transactions WHERE id = ?;''', (rowid,))
+		row = cursor.fetchone()
+		if row:
+			return self.si.snippet_text(row[0])
+		return ""
+
+	def _search(self, event=None) -> None:
+		'''Query the full-text index and list matching rows with snippets'''
+		for item in self.results_tree.get_children():
+			self.results_tree.delete(item)
+		self.results = {}
+		query = self.search_entry.get().strip()
+		if (not query) or (not self.notebook.cursor):
+			self.search_count.config(text="Matches: 0")
+			return
+		if not self.si.available(self.notebook.cursor):
+			self.search_count.config(text="Search index unavailable")
+			return
+		t1 = time.time()
+		try:
+			matches = self.si.search(self.notebook.cursor, query, raw=self.syntax_toggle_int.get() == 1, include_fuzz=self.fuzz_toggle_int.get() == 1)
+		except sqlite3.OperationalError as e:
+			self.search_count.config(text=f"Query error: {e}")
+			return
+		bodies = {}
+		for source, rowid, field in matches:
+			snippet = self.si.snippet(self._field_text(source, rowid, field, bodies), query)
+			iid = self.results_tree.insert("", "end", values=(source, rowid, field, snippet))
+			self.results[iid] = (source, rowid)
+		# Snippets are built on the Tk thread, so they count towards the time shown
+		elapsed = round((time.time() - t1) * 1000, 1)
+		self.search_count.config(text=f"Matches: {len(matches)} ({elapsed} ms)")
@@ -87,27 +87,29 @@ class SelectPayloads:
 		self.selections = {}
 
 	def prepare_template(self, text) -> tuple:
-		'''Return the text with format variables in it for payloads'''
+		'''Return the text with format variables in it for payloads, the payload files and the text each variable replaced'''
 		text_content = text.__dict__["children"]["!text"].get(1.0, END)[:-1]
 		text_lines = re.split(r"\r?\n", text_content)
-		insertion_line_numbers = sorted(self.selections.keys())
 		payload_num = 0
 		ordered_file_paths = []
-		for line in insertion_line_numbers:
-			selections = sorted(self.selections[line], reverse=True, key=lambda x:x[0])
-			sel_len = len(selections)
-			payload_num += sel_len
+		originals = []
+		for line in range(1, len(text_lines) + 1):
 			text_line = text_lines[line-1]
-			file_paths = []
-			for start_idx, stop_idx, filepath in selections:
-				part1 = text_line[:start_idx]
-				part2 = text_line[stop_idx:]
-				payload_num -= 1
-				text_line = part1 + "{" + str(payload_num) + "}" + part2
-				file_paths.insert(0, filepath)
-			ordered_file_paths.extend(file_paths)
-			payload_num += sel_len
-			text_lines[line-1] = text_line
+			parts = []
+			last_idx = 0
+			for start_idx, stop_idx, filepath in sorted(self.selections.get(line, []), key=lambda x:x[0]):
+				# Literal braces are escaped so only payload positions are format variables
+				parts.append(self._escape_braces(text_line[last_idx:start_idx]))
+				parts.append("{" + str(payload_num) + "}")
+				payload_num += 1
+				ordered_file_paths.append(filepath)
+				originals.append(text_line[start_idx:stop_idx])
+				last_idx = stop_idx
+			parts.append(self._escape_braces(text_line[last_idx:]))
+			text_lines[line-1] = "".join(parts)
 		text_content = "\n".join(text_lines)
-		return (text_content, ordered_file_paths)
+		return (text_content, ordered_file_paths, originals)
 
+	def _escape_braces(self, text: str) -> str:
+		'''Return text with braces doubled for str.format'''
+		return text.replace("{", "{{").replace("}", "}}")
@@ -0,0 +1,136 @@
+#! /usr/bin/env python3
+
+import ast
+import json
+from urllib.parse import urlparse
+
+class SiteNode:
+	__slots__ = ("label", "request_id", "last", "method", "params", "hits", "children")
+
+	def __init__(self, label: str, request_id: int=-1, last: bool=False) -> None:
+		'''Initialize a site map level'''
+		self.label = label
+		self.request_id = request_id
+		self.last = last
+		self.method = ""
+		self.params = ""
+		self.hits = 0
+		self.children = {}
+
+class SiteMap:
+
+	def __init__(self) -> None:
+		'''Initialize an empty site map trie'''
+		self.root = SiteNode("")
+
+	def _split_url(self, method: str, request_params: str, url: str) -> list:
+		'''Return the levels of a URL: origin, path segments, then method and parameters'''
+		urlparts = urlparse(url)
+		folders = [i for i in urlparts.path.split("/") if i]
+		folders.insert(0, urlparts.scheme + "://" + urlparts.netloc)
+		folders.append(method + request_params)
+		return folders
+
+	def add(self, request_id: int, method: str, request_params: str, url: str) -> SiteNode:
+		'''Add a request to the trie and return its leaf, nodes keep the first request to reach them'''
+		node = self.root
+		folders = self._split_url(method, request_params, url)
+		last = len(folders) - 1
+		for i, label in enumerate(folders):
+			child = node.children.get(label)
+			if child is None:
+				child = SiteNode(label, request_id, i == last)
+				node.children[label] = child
+			child.hits += 1
+			node = child
+		node.method = method
+		node.params = request_params
+		return node
+
+	def build(self, rows) -> "SiteMap":
+		'''Add (id, method, params, url) rows in one pass and return the site map'''
+		for request_id, method, request_params, url in rows:
+			self.add(request_id, method, request_params, url)
+		return self
+
+	def hosts(self) -> list:
+		'''Return the origin level nodes'''
+		return list(self.root.children.values())
+
+	def walk(self):
+		'''Yield (path, node) for every node, depth first in insertion order'''
+		stack = [(child.label, child) for child in reversed(self.hosts())]
+		while stack:
+			path, node = stack.pop()
+			yield (path, node)
+			for child in reversed(list(node.children.values())):
+				if not child.last:
+					stack.append((path + "/" + child.label, child))
+				else:
+					stack.append((path, child))
+
+	def count_endpoints(self) -> int:
+		'''Return the number of distinct (path, method, parameters) endpoints'''
+		return sum(1 for path, node in self.walk() if node.last)
+
+	def count_paths(self) -> int:
+		'''Return the number of distinct paths that received requests'''
+		return len(set(path for path, node in self.walk() if node.last))
+
+	def _param_names(self, request_params: str) -> list:
+		'''Return the parameter names stored for a request'''
+		try:
+			names = ast.literal_eval(request_params)
+		except (ValueError, SyntaxError):
+			return []
+		if isinstance(names, tuple):
+			return [str(i) for i in names]
+		if isinstance(names, str):
+			return [names]
+		return []
+
+	def parameters(self) -> dict:
+		'''Return {path: sorted parameter names} across every method seen on the path'''
+		params = {}
+		for path, node in self.walk():
+			if node.last:
+				names = params.setdefault(path, set())
+				names.update(self._param_names(node.params))
+		return {path: sorted(names) for path, names in params.items()}
+
+	def to_dict(self) -> dict:
+		'''Return the site map as nested dictionaries'''
+		result = {}
+		stack = [(self.root, result)]
+		while stack:
+			node, target = stack.pop()
+			for child in node.children.values():
+				entry = {"request_id": child.request_id, "hits": child.hits}
+				if child.last:
+					entry["method"] = child.method
+					entry["params"] = self._param_names(child.params)
+				else:
+					entry["children"] = {}
+					stack.append((child, entry["children"]))
+				target[child.label] = entry
+		return result
+
+	def to_text(self) -> str:
+		'''Return the site map as an indented tree'''
+		lines = []
+		stack = [(child, 0) for child in reversed(self.hosts())]
+		while stack:
+			node, depth = stack.pop()
+			lines.append("    " * depth + node.label)
+			for child in reversed(list(node.children.values())):
+				stack.append((child, depth + 1))
+		return "\n".join(lines)
+
+	def export(self, fpath: str) -> None:
+		'''Save the site map as JSON for a .json path, otherwise as an indented tree'''
+		f = open(fpath, "w")
+		if fpath.lower().endswith(".json"):
+			json.dump(self.to_dict(), f, indent=4)
+		else:
+			f.write(self.to_text())
+		f.close()
@@ -5,9 +5,11 @@ import contextmenu
 from tkinter import *
 import ttkbootstrap as tb
 from ttkbootstrap.scrolled import ScrolledText
-from urllib.parse import urlparse
+from tkinter import filedialog
+import bodystore
 import contentbeautifier
 import scrolledtextsearch
+import sitemap
 
 ################
 ### TREE TAB ###
@@ -20,9 +22,13 @@ class TreeTab(tb.Frame):
 		super().__init__(self.notebook)
 		self.notebook.add(self, text="Site Map") # Add itself to the notebook
 		self.cb = contentbeautifier.ContentBeautifier()
+		self.bs = bodystore.BodyStore()
 		self.sts = scrolledtextsearch.ScrolledTextSearch("#EE8A12")
 		self.cm = contextmenu.ContextMenu()
 		self.last_clicked = -1
+		self.site_map = sitemap.SiteMap()
+		self.tree_nodes = {}
+		self.expanded = set()
 		self._add_widgets()
 
 	def _add_widgets(self) -> None:
@@ -57,6 +63,8 @@ class TreeTab(tb.Frame):
 		self._add_request_context_menu()
 		# Add the right click menu for the response text box
 		self._add_response_context_menu()
+		# Add the right click menu for the site tree
+		self._add_tree_context_menu()
 
 	def _add_treeview(self) -> None:
 		'''Add site tree view'''
@@ -64,6 +72,8 @@ class TreeTab(tb.Frame):
 		self.tree.heading('#0', text="Sites")
 		self.tree.place(relx=0.009, rely=0.015, relwidth=0.48, relheight=0.97)
 		self.tree.bind("<Button-1>", self._fetch_transaction)
+		self.tree.bind("<<TreeviewOpen>>", self._expand_node)
+		self.tree.bind("<Button-3>", self._right_click_tree)
 
 	def _add_request_textbox(self) -> None:
 		'''Add the text box for a request'''
@@ -174,6 +184,29 @@ class TreeTab(tb.Frame):
 		finally:
 			self.mu_response.grab_release()
 
+	def _add_tree_context_menu(self) -> None:
+		'''Add a right click menu on the site tree'''
+		self.mu_tree = Menu(self, tearoff=False)
+		self.mu_tree.add_command(label="Export Site Map", command=self._export_site_map)
+		self.mu_tree.bind("<FocusOut>", self._close_tree_menu)
+
+	def _close_tree_menu(self, event=None) -> None:
+		'''Close the right click menu if you left click off it'''
+		self.mu_tree.unpost()
+
+	def _right_click_tree(self, event) -> None:
+		'''Open the right click popup window'''
+		try:
+			self.mu_tree.tk_popup(event.x_root + 1, event.y_root + 1)
+		finally:
+			self.mu_tree.grab_release()
+
+	def _export_site_map(self) -> None:
+		'''Save the site map as an indented tree, or as JSON for a .json file'''
+		fpath = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text", "*.txt"), ("JSON", "*.json")])
+		if fpath:
+			self.site_map.export(fpath)
+
 	def _send_to_editor(self) -> None:
 		'''Send request to editor'''
 		if self.last_clicked != -1:
@@ -187,65 +220,60 @@ class TreeTab(tb.Frame):
 			self.notebook.select(4)
 
 	def _populate_treeview(self) -> None:
-		'''Add website tree data to the widget'''
-		self.tree_map = {}
+		'''Build the site map and add only the host level to the widget'''
+		self.site_map = sitemap.SiteMap()
+		self.tree_nodes = {}
+		self.expanded = set()
 		for item in self.tree.get_children():
 			self.tree.delete(item)
 		self.notebook.cursor.execute('''SELECT id, request_method, request_params, request_url FROM transactions;''')
-		rows = self.notebook.cursor.fetchall()
-		for row in rows:
-			self._add_url(*row)
-
-	def _add_url(self, request_id: int, method: str, request_params: str, url: str) -> None:
-		'''Add a URL to the tree'''
-		# parse URL for interesting parts
-		urlparts = urlparse(url)
-		folders = [i for i in urlparts.path.split("/") if i]
-		query = method + request_params
-		# Finalize list
-		folders.insert(0, urlparts.scheme + "://" + urlparts.netloc)
-		folders.append(query)
-		# Insert path
-		self._add_url_path(request_id, folders)
-
-	def _add_url_path(self, request_id: int, folders: list, parent_id="", urlstr: str="") -> None:
-		'''Recursive mapping'''
-		if folders:
-			label = folders.pop(0)
-			if folders:
-				last = False
-			else:
-				last = True
-			if urlstr:
-				level = urlstr + "/" + label
-			else:
-				level = label
-			if level not in self.tree_map:
-				l_id = self.tree.insert(parent_id, index="end", iid=None, text=label, values=(level,))
-				self.tree_map[level] = {"parent_id": parent_id, "level_id": l_id, "request_id": request_id, "last": last}
-				self._add_url_path(request_id, folders, l_id, level)
-			else:
-				parent_id = self.tree_map[level]["level_id"]
-				self._add_url_path(request_id, folders, parent_id, level)
+		while 1:
+			rows = self.notebook.cursor.fetchmany(1000)
+			if not rows:
+				break
+			self.site_map.build(rows)
+		# Deeper levels are inserted when their parent is expanded
+		self._insert_children("", self.site_map.root)
+
+	def _insert_children(self, parent_id: str, node) -> None:
+		'''Insert the direct children of a site map node into the widget'''
+		for child in node.children.values():
+			iid = self.tree.insert(parent_id, index="end", iid=None, text=child.label)
+			self.tree_nodes[iid] = child
+			if child.children:
+				# A placeholder gives the item an expand arrow until it is opened
+				self.tree.insert(iid, index="end", iid=None, text="")
+		self.expanded.add(parent_id)
+
+	def _expand_node(self, event=None) -> None:
+		'''Insert the children of an item the first time it is opened'''
+		iid = self.tree.focus()
+		node = self.tree_nodes.get(iid)
+		if node and iid not in self.expanded:
+			self.tree.delete(*self.tree.get_children(iid))
+			self._insert_children(iid, node)
 
 	def _fetch_transaction(self, event):
 		'''Retrieve the relevant transaction request and response data'''
 		try:
 			row = self.tree.identify_row(event.y)
-			url = self.tree.item(row, "values")[0]
+			node = self.tree_nodes.get(row)
 		except:
-			url = ""
-		if url:
-			if self.tree_map[url]["last"] == True:
-				_id = self.tree_map[url]["request_id"]
+			node = None
+		if node:
+			if node.last == True:
+				_id = node.request_id
 				if _id != self.last_clicked:
 					self.last_clicked = _id
-					self.notebook.cursor.execute('''SELECT request_method, request_url, request_headers, request_body FROM transactions WHERE id = ?;''',(_id,))
+					self.notebook.cursor.execute('''SELECT t.request_method, t.request_url, t.request_headers, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.request_body_hash WHERE t.id = ?;''',(_id,))
 					request_info = self.notebook.cursor.fetchone()
-					self.notebook.cursor.execute('''SELECT response_status_code, response_status_message, response_headers, response_body FROM transactions WHERE id = ?;''',(_id,))
+					self.notebook.cursor.execute('''SELECT t.response_status_code, t.response_status_message, t.response_headers, b.content FROM transactions t LEFT JOIN bodies b ON b.hash = t.response_body_hash WHERE t.id = ?;''',(_id,))
 					response_info = self.notebook.cursor.fetchone()
-					raw_request = self.cb.rebuild_request(*request_info)
-					raw_response = self.cb.rebuild_response(*response_info)
+					# Bodies are only decompressed once their row is opened
+					method, url, headers, body = request_info
+					raw_request = self.cb.rebuild_request(method, url, headers, self.bs.decode(body))
+					status_code, msg, headers, body = response_info
+					raw_response = self.cb.rebuild_response(status_code, msg, headers, self.bs.decode(body))
 					# Set the text in each pane.
 					### ENABLE DISABLED ScrolledText PANE - !!! Its insane it had to be done this way !!!
 					self.request_textbox.__dict__["children"]["!text"].configure(state="normal")